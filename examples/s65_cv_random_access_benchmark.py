@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import time
+import numpy as np
+
+
+"""
+Copyright (C) 2026 Denis Polygalov,
+Laboratory for Circuit and Behavioral Physiology,
+RIKEN Center for Brain Science, Saitama, Japan.
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, a copy is available at
+http://www.fsf.org/
+"""
+
+
+"""
+* ABOUT THIS FILE *
+
+Measure random access speed (frames per second) of the CMuPaMovieCV.
+The 'before' column is the old behavior - seek on every read.
+The 'after' column is read_frame() with keyframe positions known,
+where consecutive and nearby frames are read without seeking.
+Usage: python s65_cv_random_access_benchmark.py [file.avi]
+"""
+
+
+def make_indices(s_pattern, i_nframes, i_nreads):
+    oc_rng = np.random.default_rng(0)
+    if s_pattern == "random":
+        return oc_rng.integers(0, i_nframes, size=i_nreads)
+    elif s_pattern == "sorted_random":
+        return np.sort(oc_rng.integers(0, i_nframes, size=i_nreads))
+    elif s_pattern == "scrubbing":
+        # small steps back and forth, like browsing the movie in a viewer
+        return np.cumsum(oc_rng.integers(-2, 6, size=i_nreads)) % i_nframes
+    elif s_pattern == "every_4th":
+        return np.arange(0, i_nreads * 4, 4) % i_nframes
+    else:
+        raise ValueError("Unsupported pattern: %s" % s_pattern)
+#
+
+
+def measure_fps(oc_movie, na_indices, b_seek_every_time):
+    f_t0 = time.perf_counter()
+    for idx in na_indices:
+        if b_seek_every_time:
+            oc_movie.seek(int(idx))
+            oc_movie.read_next_frame()
+        else:
+            oc_movie.read_frame(int(idx))
+    return len(na_indices) / (time.perf_counter() - f_t0)
+#
+
+
+def main():
+    if len(sys.argv) > 1:
+        t_input_files = (sys.argv[1],)
+    else:
+        t_input_files = ("CW2003_H14_M57_S54_behavCam1_frame0to179.avi",) # notice comma(!)
+
+    for s_fname in t_input_files:
+        print("Input file: %s" % s_fname)
+
+    oc_movie_before = CMuPaMovieCV(t_input_files)
+    oc_movie_after  = CMuPaMovieCV(t_input_files, b_use_keyframes=True)
+    print("Number of keyframes: %d of %d frames" % (oc_movie_after.t_keyframes[0].size, oc_movie_after.i_nframes))
+    print()
+
+    print("%-16s %12s %12s" % ("pattern", "before, FPS", "after, FPS"))
+    for s_pattern in ("random", "sorted_random", "scrubbing", "every_4th"):
+        na_indices = make_indices(s_pattern, oc_movie_after.i_nframes, 200)
+        f_fps_before = measure_fps(oc_movie_before, na_indices, True)
+        f_fps_after  = measure_fps(oc_movie_after,  na_indices, False)
+        print("%-16s %12.1f %12.1f" % (s_pattern, f_fps_before, f_fps_after))
+#
+
+
+if __name__ == '__main__':
+    s_base_dir, _ = os.path.split(os.getcwd())
+    sys.path.append(s_base_dir)
+    from mendouscopy.mupamovie import CMuPaMovieCV
+    main()
+#
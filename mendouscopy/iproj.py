@@ -53,6 +53,20 @@ class CIntensityProjector(object):
 
         self.na_iproj_mean = np.zeros([i_frame_h, i_frame_w], dtype=np.float64)
 
+        self.na_iproj_fet = np.zeros([i_frame_h, i_frame_w], dtype=np.float64)
+        self.set_features(features)
+
+    def set_features(self, features):
+        """
+        Set the 'features' array which defines frames of the features (local)
+        intensity projection. If the features are known only after all frames
+        were processed by the process_frame(), call this method and then
+        the process_featured_frame() for each of self.na_featured_frame_ids.
+        """
+        self.i_fet_frame_idx = 0
+        self.i_fet_frame_idx_accepted = 0
+        self.na_iproj_fet.fill(0)
+
         if isinstance(features, np.ndarray):
             print("CIntensityProjector: features.shape:", features.shape)
             print("CIntensityProjector: features.ndim:", features.ndim)
@@ -77,7 +91,6 @@ class CIntensityProjector(object):
         else:
             print("CIntensityProjector: the 'features' array is NOT provided!")
             self.na_featured_frame_ids = None
-        self.na_iproj_fet = np.zeros([i_frame_h, i_frame_w], dtype=np.float64)
 
     def process_frame(self, na_input, b_verbose=False):
         if self._b_projection_finalized:
@@ -117,17 +130,35 @@ class CIntensityProjector(object):
             self.i_fet_frame_idx < self.na_featured_frame_ids.size:
 
             if self._i_nframes_proc == self.na_featured_frame_ids[self.i_fet_frame_idx]:
-                f_max_val = na_input.max()
-                if f_max_val >= 1:
-                    self.na_iproj_fet[...] += (na_input.astype(np.float64) / f_max_val)
-                    self.i_fet_frame_idx_accepted += 1
-                self.i_fet_frame_idx += 1
-
-                if b_verbose:
-                    if f_max_val >= 1:
-                        print("CIntensityProjector: frame: %i max_val: %.2f (ACCEPTED)" % (self._i_nframes_proc, f_max_val))
-                    else:
-                        print("CIntensityProjector: frame: %i max_val: %.2f (rejected)" % (self._i_nframes_proc, f_max_val))
+                self.__add_featured_frame(na_input, b_verbose)
+
+    def process_featured_frame(self, na_input, b_verbose=False):
+        """
+        Add the next frame of the self.na_featured_frame_ids to the features (local)
+        intensity projection only. See set_features().
+        """
+        if self._b_projection_finalized:
+            raise ValueError("Inappropriate method calling sequence. This object cannot be reused after finalization!")
+        if not isinstance(self.na_featured_frame_ids, np.ndarray) or \
+            self.i_fet_frame_idx >= self.na_featured_frame_ids.size:
+            raise ValueError("Inappropriate method calling sequence. No more featured frames expected!")
+        if na_input.shape != (self.i_frame_h, self.i_frame_w):
+            raise ValueError("Unexpected frame shape")
+        self.__add_featured_frame(na_input, b_verbose)
+
+    def __add_featured_frame(self, na_input, b_verbose):
+        i_frame_id = self.na_featured_frame_ids[self.i_fet_frame_idx]
+        f_max_val = na_input.max()
+        if f_max_val >= 1:
+            self.na_iproj_fet[...] += (na_input.astype(np.float64) / f_max_val)
+            self.i_fet_frame_idx_accepted += 1
+        self.i_fet_frame_idx += 1
+
+        if b_verbose:
+            if f_max_val >= 1:
+                print("CIntensityProjector: frame: %i max_val: %.2f (ACCEPTED)" % (i_frame_id, f_max_val))
+            else:
+                print("CIntensityProjector: frame: %i max_val: %.2f (rejected)" % (i_frame_id, f_max_val))
 
     def finalize_projection(self):
         self.d_IPROJ['IPROJ_max'] = self.na_iproj_max
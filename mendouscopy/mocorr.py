@@ -69,7 +69,8 @@ def bin_median(na_input, i_win_sz=10, b_exclude_nans=True):
 def bootstrap_template(oc_movie, i_tmpl_nframes, s_method="head", i_color_ch=0, b_verbose=False):
     """
     Read 'i_tmpl_nframes' frames from multi-part movie object 'oc_movie'
-    by using method 's_method'. Input frames will be converted to, and output is
+    by using method 's_method'. The "stride" method takes frames evenly spaced
+    over the whole movie. Input frames will be converted to, and output is
     returned as 3D array of (TIME x FRAME_HEIGHT x FRAME_WIDTH) shape and np.float32 type.
     Only single color/grayscale/np.float32 type of input supported.
     """
@@ -92,6 +93,10 @@ def bootstrap_template(oc_movie, i_tmpl_nframes, s_method="head", i_color_ch=0,
     elif s_method == "random":
         na_indices = np.random.randint(0, high=i_max_nframes, size=i_tmpl_nframes)
 
+    elif s_method == "stride":
+        i_step = np.int64(i_max_nframes / i_tmpl_nframes)
+        na_indices = np.arange(i_tmpl_nframes) * i_step
+
     else: raise ValueError("Unsupported method: %s" % s_method)
 
     oc_movie.read_frame(0)
@@ -105,8 +110,17 @@ def bootstrap_template(oc_movie, i_tmpl_nframes, s_method="head", i_color_ch=0,
             (s_method, i_tmpl_nframes, i_color_ch, repr(na_template.shape)) \
         )
 
+    if s_method == "stride":
+        # skipped frames are not decoded
+        i_old_step = oc_movie.i_step
+        oc_movie.seek(0)
+        oc_movie.set_step(i_step)
+
     for tt, idx in enumerate(na_indices):
-        oc_movie.read_frame(idx) # read the next requested frame
+        if s_method == "stride":
+            oc_movie.read_next_frame()
+        else:
+            oc_movie.read_frame(idx) # read the next requested frame
 
         if len(oc_movie.na_frame.shape) == 3:
             if i_color_ch >= oc_movie.na_frame.shape[2]:
@@ -121,5 +135,7 @@ def bootstrap_template(oc_movie, i_tmpl_nframes, s_method="head", i_color_ch=0,
         #
         # if b_verbose: print("bootstrap_template: %s" % oc_movie.get_frame_stat())
     #
+    if s_method == "stride":
+        oc_movie.set_step(i_old_step)
     return na_template
 #
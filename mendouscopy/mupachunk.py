@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+
+import os
+import json
+import zlib
+import shutil
+import collections
+import numpy as np
+import cv2 as cv
+
+from .mupamovie import CMuPaMovie
+
+
+"""
+Copyright (C) 2026 Denis Polygalov,
+Laboratory for Circuit and Behavioral Physiology,
+RIKEN Center for Brain Science, Saitama, Japan.
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, a copy is available at
+http://www.fsf.org/
+"""
+
+"""
+* ABOUT THIS FILE *
+
+Chunked movie store is a directory of zlib-compressed (t, y, x) chunks
+of a movie plus the index file (CHUNKED_INDEX_FNAME) in JSON format.
+Each chunk holds raw C-ordered pixel data of a box of the movie, chunks
+at the end of the movie and at the bottom/right edges of the frame
+are smaller than the chunk shape (no padding).
+"""
+
+CHUNKED_INDEX_FNAME = "index.json"
+CHUNKED_FORMAT_VERSION = 1
+
+
+def _chunk_fname(s_dname, it, iy, ix):
+    return os.path.join(s_dname, "%d_%d_%d.zlib" % (it, iy, ix))
+#
+
+def _ceil_div(i_a, i_b):
+    return -(-i_a // i_b)
+#
+
+class CChunkedMovieWriter(object):
+    """
+    Write frames into a chunked movie store (directory s_dname_out) by chunks
+    of t_chunk_shape = (frames, rows, columns). Can be used in place of
+    the CSingleTiffWriter, frames of other than np.uint16 type are normalized
+    into np.uint16 the same way. The index is updated every time a complete
+    set of chunks is written, so the store can be read while it is written.
+    """
+    def __init__(self, s_dname_out, b_delete_existing=False, t_chunk_shape=(32, 64, 64), i_zlib_level=6):
+        if len(t_chunk_shape) != 3 or min(t_chunk_shape) < 1:
+            raise ValueError("Wrong input: %s" % repr(t_chunk_shape))
+        if os.path.exists(s_dname_out):
+            if not b_delete_existing:
+                raise ValueError("Requested output file already exist. Die in order to prevent data loss.")
+            if not os.path.isfile(os.path.join(s_dname_out, CHUNKED_INDEX_FNAME)):
+                raise ValueError("Refuse to delete %s since it is not a chunked movie store" % s_dname_out)
+            shutil.rmtree(s_dname_out)
+        os.mkdir(s_dname_out)
+        self.s_fname_out = s_dname_out
+        self.t_chunk_shape = tuple(int(i_sz) for i_sz in t_chunk_shape)
+        self.i_zlib_level = int(i_zlib_level)
+        self.i_nframes = 0
+        self._na_slab = None # frames of the current row of chunks along the time axis
+        self._i_slab_nframes = 0
+        self._write_index()
+    #
+    def _write_index(self):
+        d_index = {
+            'format_version': CHUNKED_FORMAT_VERSION,
+            'frames': self.i_nframes - self._i_slab_nframes, # only frames already written into chunks
+            'frame_shape': None if self._na_slab is None else list(self._na_slab.shape[1:]),
+            'chunk_shape': list(self.t_chunk_shape),
+            'dtype': np.dtype(np.uint16).newbyteorder('<').str,
+            'compression': 'zlib'
+        }
+        s_idx_fname = os.path.join(self.s_fname_out, CHUNKED_INDEX_FNAME)
+        with open(s_idx_fname + ".tmp", 'w') as h_file:
+            json.dump(d_index, h_file)
+        os.replace(s_idx_fname + ".tmp", s_idx_fname)
+    #
+    def _flush_slab(self):
+        if self._i_slab_nframes == 0: return
+        it = (self.i_nframes - 1) // self.t_chunk_shape[0]
+        i_frame_h, i_frame_w = self._na_slab.shape[1:]
+        _, i_chunk_h, i_chunk_w = self.t_chunk_shape
+        for iy in range(_ceil_div(i_frame_h, i_chunk_h)):
+            for ix in range(_ceil_div(i_frame_w, i_chunk_w)):
+                na_chunk = self._na_slab[:self._i_slab_nframes, \
+                    iy * i_chunk_h:(iy + 1) * i_chunk_h, \
+                    ix * i_chunk_w:(ix + 1) * i_chunk_w \
+                ]
+                b_data = np.ascontiguousarray(na_chunk, dtype=np.dtype(np.uint16).newbyteorder('<')).tobytes()
+                with open(_chunk_fname(self.s_fname_out, it, iy, ix), 'wb') as h_file:
+                    h_file.write(zlib.compress(b_data, self.i_zlib_level))
+        self._i_slab_nframes = 0
+        self._write_index()
+    #
+    def write_next_frame(self, na_in):
+        if na_in.dtype != np.uint16:
+            na_in = cv.normalize(na_in, None, alpha=0, beta=(2**16-1), norm_type=cv.NORM_MINMAX, dtype=cv.CV_16U)
+        if na_in.ndim != 2:
+            raise ValueError("Unsupported frame shape: %s" % repr(na_in.shape))
+        if self._na_slab is None:
+            self._na_slab = np.zeros((self.t_chunk_shape[0],) + na_in.shape, dtype=np.uint16)
+        elif na_in.shape != self._na_slab.shape[1:]:
+            raise ValueError("Frame shape is not consistent: %s" % repr(na_in.shape))
+        self._na_slab[self._i_slab_nframes] = na_in
+        self._i_slab_nframes += 1
+        self.i_nframes += 1
+        if self._i_slab_nframes == self.t_chunk_shape[0]:
+            self._flush_slab()
+        return True
+    #
+    def close(self):
+        self._flush_slab()
+        self._write_index()
+    #
+    def write_last_frame(self, na_in):
+        self.write_next_frame(na_in)
+        self.close()
+    #
+#
+
+class CMuPaMovieChunked(CMuPaMovie):
+    """
+    Class represents a MultiPart Movie (chunked movie store backend).
+    The MultiPart Movie constructed from a tuple of chunked movie store
+    directory names (see CChunkedMovieWriter).
+    The directory names in the tuple must be in correct temporal order.
+    For details refer to documentation for the base class CMuPaMovie()
+    Only chunks overlapping requested frames (and the crop window) are read.
+    The read_block() returns any (t, y, x) box of the movie. Decoded chunks
+    of the last two rows of chunks (along the time axis) are kept, so
+    sequential reading decompresses each chunk only once.
+    """
+    def __init__(self, t_file_names, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        self._od_chunks = collections.OrderedDict() # (file_idx, it, iy, ix) -> decoded chunk
+
+        l_info = self._init_parts('chunked')
+        self.t_chunk_shapes = tuple(tuple(int(i_sz) for i_sz in d_index['chunk_shape']) for d_index in l_info)
+        self.i_max_cached_chunks = 2 * max( \
+            _ceil_div(int(d_index['height']), t_chunk_shape[1]) * _ceil_div(int(d_index['width']), t_chunk_shape[2]) \
+            for d_index, t_chunk_shape in zip(l_info, self.t_chunk_shapes) \
+        )
+
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        with open(os.path.join(self.t_file_names[file_idx], CHUNKED_INDEX_FNAME)) as h_file:
+            d_store = json.load(h_file)
+        if d_store.get('format_version') != CHUNKED_FORMAT_VERSION or d_store.get('frame_shape') is None:
+            raise ValueError("Unsupported or empty chunked movie store: %s" % self.t_file_names[file_idx])
+        return (d_store, self.t_file_names[file_idx])
+
+    def _close_part(self, file_idx, t_part):
+        pass # nothing to close, decoded chunks remain valid
+
+    def _probe_part(self, file_idx, t_part):
+        d_store = t_part[0]
+        return {
+            'frames': int(d_store['frames']),
+            'frame_rate': np.nan, # frame rate is not stored
+            'width':  int(d_store['frame_shape'][1]),
+            'height': int(d_store['frame_shape'][0]),
+            'format': str(np.dtype(d_store['dtype'])),
+            'chunk_shape': np.array(d_store['chunk_shape'], dtype=np.int64)
+        }
+
+    def _get_chunk(self, file_idx, it, iy, ix):
+        t_key = (file_idx, it, iy, ix)
+        na_chunk = self._od_chunks.get(t_key)
+        if na_chunk is not None:
+            self._od_chunks.move_to_end(t_key)
+            return na_chunk
+        d_store, s_dname = self._get_part(file_idx)
+        i_chunk_t, i_chunk_h, i_chunk_w = self.t_chunk_shapes[file_idx]
+        i_frame_h, i_frame_w = d_store['frame_shape']
+        t_shape = ( \
+            min(i_chunk_t, int(d_store['frames']) - it * i_chunk_t), \
+            min(i_chunk_h, i_frame_h - iy * i_chunk_h), \
+            min(i_chunk_w, i_frame_w - ix * i_chunk_w) \
+        )
+        with open(_chunk_fname(s_dname, it, iy, ix), 'rb') as h_file:
+            b_data = zlib.decompress(h_file.read())
+        na_chunk = np.frombuffer(b_data, dtype=d_store['dtype']).reshape(t_shape)
+        self._od_chunks[t_key] = na_chunk
+        while len(self._od_chunks) > self.i_max_cached_chunks:
+            self._od_chunks.popitem(last=False)
+        return na_chunk
+
+    def _read_part_block(self, file_idx, i_t0, i_t1, i_y0, i_y1, i_x0, i_x1, na_out):
+        """
+        Copy the box of frames (relative frame numbers i_t0 ~ i_t1) of the file file_idx
+        into the na_out touching only chunks which overlap the box.
+        """
+        i_chunk_t, i_chunk_h, i_chunk_w = self.t_chunk_shapes[file_idx]
+        for it in range(i_t0 // i_chunk_t, _ceil_div(i_t1, i_chunk_t)):
+            for iy in range(i_y0 // i_chunk_h, _ceil_div(i_y1, i_chunk_h)):
+                for ix in range(i_x0 // i_chunk_w, _ceil_div(i_x1, i_chunk_w)):
+                    na_chunk = self._get_chunk(file_idx, it, iy, ix)
+                    # intersection of the chunk and the box in the frame coordinates
+                    i_ta, i_tb = max(i_t0, it * i_chunk_t), min(i_t1, it * i_chunk_t + na_chunk.shape[0])
+                    i_ya, i_yb = max(i_y0, iy * i_chunk_h), min(i_y1, iy * i_chunk_h + na_chunk.shape[1])
+                    i_xa, i_xb = max(i_x0, ix * i_chunk_w), min(i_x1, ix * i_chunk_w + na_chunk.shape[2])
+                    na_out[i_ta - i_t0:i_tb - i_t0, i_ya - i_y0:i_yb - i_y0, i_xa - i_x0:i_xb - i_x0] = \
+                        na_chunk[ \
+                            i_ta - it * i_chunk_t:i_tb - it * i_chunk_t, \
+                            i_ya - iy * i_chunk_h:i_yb - iy * i_chunk_h, \
+                            i_xa - ix * i_chunk_w:i_xb - ix * i_chunk_w \
+                        ]
+
+    def _get_window(self, file_idx):
+        # (y, x, h, w) of the full frame to be read
+        if self._t_window is not None: return self._t_window
+        i_frame_h, i_frame_w = self._get_part(file_idx)[0]['frame_shape']
+        return (0, 0, i_frame_h, i_frame_w)
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        i_y, i_x, i_h, i_w = self._get_window(file_idx)
+        na_frame = np.empty((1, i_h, i_w), dtype=self._get_part(file_idx)[0]['dtype'])
+        self._read_part_block(file_idx, frame_num, frame_num + 1, i_y, i_y + i_h, i_x, i_x + i_w, na_frame)
+        return self._bin_frame(na_frame[0]) if self.i_bin > 1 else na_frame[0]
+
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        if self.i_bin > 1:
+            super()._decode_block(file_idx, frame_num, i_count, na_out)
+            return
+        i_y, i_x, i_h, i_w = self._get_window(file_idx)
+        self._read_part_block(file_idx, frame_num, frame_num + i_count, i_y, i_y + i_h, i_x, i_x + i_w, na_out)
+
+    def read_block(self, i_t0, i_t1, i_y0=0, i_y1=None, i_x0=0, i_x1=None):
+        """
+        Return (T x H x W) box of the movie: absolute frame numbers i_t0 ~ i_t1,
+        rows i_y0 ~ i_y1 and columns i_x0 ~ i_x1 of the full frame (crop window
+        and binning are not applied). Only chunks overlapping the box are read.
+        The current position and the self.na_frame are not changed.
+        """
+        i_frame_h, i_frame_w = int(self.df_info['height'][0]), int(self.df_info['width'][0])
+        if i_y1 is None: i_y1 = i_frame_h
+        if i_x1 is None: i_x1 = i_frame_w
+        if not (0 <= i_t0 < i_t1 <= self.na_ends[-1] and 0 <= i_y0 < i_y1 <= i_frame_h and 0 <= i_x0 < i_x1 <= i_frame_w):
+            raise ValueError("Wrong input: %s" % repr((i_t0, i_t1, i_y0, i_y1, i_x0, i_x1)))
+
+        self._stop_prefetch()
+        na_out = np.empty((i_t1 - i_t0, i_y1 - i_y0, i_x1 - i_x0), dtype=self._get_part(0)[0]['dtype'])
+        i_abs = i_t0
+        while i_abs < i_t1:
+            rel_file_idx, rel_frame_num = self.abs2rel(i_abs)
+            i_nframes = min(int(self.na_ends[rel_file_idx]), i_t1) - i_abs
+            self._read_part_block(rel_file_idx, rel_frame_num, rel_frame_num + i_nframes, \
+                i_y0, i_y1, i_x0, i_x1, na_out[i_abs - i_t0:i_abs - i_t0 + i_nframes])
+            i_abs += i_nframes
+        return na_out
+    #
+#
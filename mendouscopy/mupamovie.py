@@ -3,7 +3,14 @@
 
 import io
 import os
+import collections
+import queue
+import struct
+import time
+import weakref
+import threading
 import zipfile as zf
+import concurrent.futures
 import numpy as np
 import pandas
 import cv2 as cv
@@ -30,120 +37,1042 @@ along with this program; if not, a copy is available at
 http://www.fsf.org/
 """
 
+# file name suffix of the sidecar index files, see _load_index()/_save_index()
+SIDECAR_INDEX_SUFFIX = ".mpidx.npz"
+SIDECAR_INDEX_VERSION = 1
+
+
+def _load_index(s_fname, s_backend):
+    """
+    Load sidecar index of the s_fname file previously stored by _save_index().
+    Return dictionary or None if the index does not exist, was made by another
+    backend or is out of date (the file size or modification time changed).
+    """
+    s_idx_fname = s_fname + SIDECAR_INDEX_SUFFIX
+    if not os.path.isfile(s_idx_fname): return None
+    try:
+        with np.load(s_idx_fname, allow_pickle=False) as oc_npz:
+            d_index = {s_key: oc_npz[s_key] for s_key in oc_npz.files}
+    except (OSError, ValueError, zf.BadZipFile):
+        return None
+    # unwrap scalars saved as 0-dimensional arrays
+    d_index = {s_key: na_val.item() if na_val.ndim == 0 else na_val for s_key, na_val in d_index.items()}
+    oc_stat = os.stat(s_fname)
+    if d_index.get('index_version') != SIDECAR_INDEX_VERSION: return None
+    if d_index.get('backend') != s_backend: return None
+    if d_index.get('file_size') != oc_stat.st_size: return None
+    if d_index.get('file_mtime_ns') != oc_stat.st_mtime_ns: return None
+    return d_index
+#
+
+def _save_index(s_fname, s_backend, d_index):
+    """
+    Store the d_index dictionary (of numbers, strings and Numpy arrays)
+    as a sidecar index file next to the s_fname file. Failure to write
+    the index (read only media for example) is silently ignored.
+    """
+    oc_stat = os.stat(s_fname)
+    d_out = dict(d_index)
+    d_out['index_version'] = SIDECAR_INDEX_VERSION
+    d_out['backend'] = s_backend
+    d_out['file_size'] = oc_stat.st_size
+    d_out['file_mtime_ns'] = oc_stat.st_mtime_ns
+    s_idx_fname = s_fname + SIDECAR_INDEX_SUFFIX
+    try:
+        with open(s_idx_fname + ".tmp", 'wb') as h_file:
+            np.savez(h_file, **d_out)
+        os.replace(s_idx_fname + ".tmp", s_idx_fname)
+    except OSError:
+        pass
+#
+
+def _scan_avi_keyframes(s_fname):
+    """
+    Return sorted array of keyframe numbers of the (first) video stream
+    as listed in the legacy index (the idx1 chunk) of an AVI file.
+    Empty array is returned if the file is not an AVI or has no index.
+    """
+    na_empty = np.zeros(0, dtype=np.int64)
+    with open(s_fname, 'rb') as h_file:
+        b_head = h_file.read(12)
+        if len(b_head) < 12 or b_head[0:4] != b'RIFF' or b_head[8:12] != b'AVI ':
+            return na_empty
+        # walk over top level chunks ('LIST' hdrl, 'LIST' movi, ...) until the idx1 found
+        while True:
+            b_chunk = h_file.read(8)
+            if len(b_chunk) < 8: return na_empty
+            b_ckid, i_size = struct.unpack('<4sI', b_chunk)
+            if b_ckid == b'idx1': break
+            h_file.seek(i_size + (i_size & 1), os.SEEK_CUR) # chunks are word-aligned
+        b_index = h_file.read(i_size)
+
+    na_index = np.frombuffer(b_index[:len(b_index) // 16 * 16], \
+        dtype=[('ckid', 'S4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4')])
+    # video chunks are '##dc' (compressed) or '##db' (uncompressed) where ## is the stream number
+    na_is_video = np.char.endswith(na_index['ckid'], b'dc') | np.char.endswith(na_index['ckid'], b'db')
+    if not na_is_video.any(): return na_empty
+    b_stream = na_index['ckid'][na_is_video][0][:2]
+    na_video = na_index[na_is_video & np.char.startswith(na_index['ckid'], b_stream)]
+    return np.flatnonzero(na_video['flags'] & 0x10).astype(np.int64) # 0x10 is AVIIF_KEYFRAME
+#
+
+def _walk_tiff_ifds(h_file):
+    """
+    Walk the chain of IFDs of the TIFF (or BigTIFF) file once and return
+    (ifd_offsets, data_offsets, data_bytecounts) int64 arrays, the last two
+    are (pages x strips, or tiles, per page). No per-page objects are created,
+    so memory use is 8 bytes per offset no matter how many pages are there.
+    """
+    h_file.seek(0)
+    b_header = h_file.read(16)
+    s_bo = {b'II': '<', b'MM': '>'}.get(b_header[:2])
+    if s_bo is None:
+        raise ValueError("Unexpected file format, not a TIFF file")
+    i_version = struct.unpack(s_bo + 'H', b_header[2:4])[0]
+    if i_version == 42:
+        s_count, s_offset, s_value_count = 'H', 'I', 'u4'
+        i_next = struct.unpack(s_bo + 'I', b_header[4:8])[0]
+    elif i_version == 43:
+        s_count, s_offset, s_value_count = 'Q', 'Q', 'u8'
+        i_next = struct.unpack(s_bo + 'Q', b_header[8:16])[0]
+    else:
+        raise ValueError("Unexpected file format, TIFF version: %d" % i_version)
+    i_count_size = struct.calcsize(s_count)
+    i_offset_size = struct.calcsize(s_offset)
+    s_entry = s_bo + 'HH' + s_offset + '%ds' % i_offset_size
+    i_entry_size = struct.calcsize(s_entry)
+    # StripOffsets, TileOffsets -> 0; StripByteCounts, TileByteCounts -> 1
+    d_data_tags = {273: 0, 324: 0, 279: 1, 325: 1}
+    # SHORT, LONG, LONG8 value types
+    d_data_types = {3: 'H', 4: 'I', 16: 'Q'}
+
+    na_ifd_offsets = np.empty(1024, dtype=np.int64)
+    na_data = None
+    i_npages = 0
+    l_positions = [] # (position, tag) of data tags in the previous IFD, usually the same in all IFDs
+    while i_next != 0:
+        h_file.seek(i_next)
+        i_ntags = struct.unpack(s_bo + s_count, h_file.read(i_count_size))[0]
+        i_ifd_size = i_ntags * i_entry_size
+        b_ifd = h_file.read(i_ifd_size + i_offset_size)
+        if len(b_ifd) != i_ifd_size + i_offset_size:
+            raise ValueError("Corrupted IFD at offset %d" % i_next)
+        if len(l_positions) != 2 or \
+           not all(i_pos < i_ifd_size and struct.unpack_from(s_bo + 'H', b_ifd, i_pos)[0] == i_tag for i_pos, i_tag in l_positions):
+            l_positions = [(i_pos, i_tag) for i_pos in range(0, i_ifd_size, i_entry_size) \
+                for i_tag in struct.unpack_from(s_bo + 'H', b_ifd, i_pos) if i_tag in d_data_tags]
+        l_values = [None, None]
+        for i_pos, i_tag in l_positions:
+            _, i_type, i_count, b_values = struct.unpack_from(s_entry, b_ifd, i_pos)
+            if i_type not in d_data_types:
+                raise ValueError("Unexpected type %d of the tag %d at the page %d" % (i_type, i_tag, i_npages))
+            s_values = '%s%d%s' % (s_bo, i_count, d_data_types[i_type])
+            i_size = struct.calcsize(s_values)
+            if i_size > i_offset_size:
+                h_file.seek(struct.unpack(s_bo + s_offset, b_values)[0])
+                b_values = h_file.read(i_size)
+            l_values[d_data_tags[i_tag]] = struct.unpack_from(s_values, b_values)
+        if l_values[0] is None or l_values[1] is None or len(l_values[0]) != len(l_values[1]):
+            raise ValueError("Unable to find image data of the page %d" % i_npages)
+        if na_data is None:
+            na_data = np.empty((2, na_ifd_offsets.shape[0], len(l_values[0])), dtype=np.int64)
+        elif len(l_values[0]) != na_data.shape[2]:
+            raise ValueError("Number of strips (or tiles) is not consistent at the page %d" % i_npages)
+        if i_npages == na_ifd_offsets.shape[0]:
+            na_ifd_offsets = np.concatenate((na_ifd_offsets, np.empty_like(na_ifd_offsets)))
+            na_data = np.concatenate((na_data, np.empty_like(na_data)), axis=1)
+        na_ifd_offsets[i_npages] = i_next
+        na_data[0, i_npages] = l_values[0]
+        na_data[1, i_npages] = l_values[1]
+        i_npages += 1
+        i_next = struct.unpack(s_bo + s_offset, b_ifd[i_ifd_size:])[0]
+    if na_data is None:
+        raise ValueError("Unexpected file format, no pages found")
+    return na_ifd_offsets[:i_npages].copy(), na_data[0, :i_npages].copy(), na_data[1, :i_npages].copy()
+#
+
+def _scan_ffii_frames(na_mmap):
+    """
+    Return (frame_height, frame_width, array of pixel data offsets) of all
+    complete frames of the memory-mapped raw FFII file. Each frame is stored
+    as '>2I' (height, width) header followed by height * width uint8 pixels.
+    Incomplete frame at the end of the file (interrupted recording) is ignored.
+    """
+    i_size = na_mmap.shape[0]
+    if i_size < 8:
+        raise ValueError("Unexpected file format, the file is too short")
+    i_frame_h, i_frame_w = struct.unpack('>2I', na_mmap[0:8].tobytes())
+    i_stride = 8 + i_frame_h * i_frame_w
+    if i_frame_h * i_frame_w == 0 or i_stride > i_size:
+        raise ValueError("Unexpected file format, wrong frame size: %s" % repr((i_frame_h, i_frame_w)))
+
+    # usually all frames are of the same size, check all headers at once
+    i_nframes = i_size // i_stride
+    na_headers = np.ndarray((i_nframes, 2), dtype='>u4', buffer=na_mmap, strides=(i_stride, 4))
+    if (na_headers[:, 0] == i_frame_h).all() and (na_headers[:, 1] == i_frame_w).all():
+        return i_frame_h, i_frame_w, np.arange(i_nframes, dtype=np.int64) * i_stride + 8
+
+    # otherwise walk over headers one by one to find out where it goes wrong
+    l_offsets = []
+    i_offset = 0
+    while i_offset + i_stride <= i_size:
+        t_hw = struct.unpack('>2I', na_mmap[i_offset:i_offset + 8].tobytes())
+        if t_hw != (i_frame_h, i_frame_w):
+            raise ValueError("Frame size %s is not consistent at offset %d" % (repr(t_hw), i_offset))
+        l_offsets.append(i_offset + 8)
+        i_offset += i_stride
+    return i_frame_h, i_frame_w, np.array(l_offsets, dtype=np.int64)
+#
+
 class CMuPaMovie(object):
     """
     Base class represents a MultiPart Movie.
     The MultiPart Movie constructed from a tuple of video file names.
     The file names in the tuple must be in correct temporal order.
+    If i_prefetch_depth > 0 the read_next_frame() method does not decode
+    frames by itself but takes them from a queue (up to i_prefetch_depth
+    frames long) filled in advance by a background thread.
+    If b_use_index is True, information about each file is stored in a sidecar
+    index file (file_name + SIDECAR_INDEX_SUFFIX) and re-used next time the
+    same (not modified) file is opened.
+    Files (parts) are opened lazily, the first time a frame is read from them.
+    Files are opened by the constructor only if the information about them is
+    not available from the sidecar index. If i_max_open_files is not None,
+    the least recently used files are closed so no more than i_max_open_files
+    are open at the same time. The next file is opened in advance (by a
+    background thread) when reading approaches the end of the current file.
+    If i_cache_bytes > 0, up to i_cache_bytes of decoded frames are kept in
+    a cache (least recently used frames are dropped first) so repeated reading
+    of the same frames by read_frame()/read_next_frame() does not decode them
+    again. Cached frames (and so self.na_frame) are read-only in this case.
+    If t_crop = (x, y, w, h) is not None, only this window of each frame is
+    returned. If i_bin > 1, each i_bin x i_bin block of pixels (of the window)
+    is averaged into a single pixel. Both are applied by the reader, so the
+    self.t_frame_hw and self.shape describe frames after cropping and binning
+    while self.df_info describes the video files.
     """
-    def __init__(self, t_file_names):
+    def __init__(self, t_file_names, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1):
+        if i_max_open_files is not None and i_max_open_files < 2:
+            raise ValueError("Wrong input: i_max_open_files must be None or at least 2")
+        if t_crop is not None and len(t_crop) != 4:
+            raise ValueError("Wrong input: t_crop must be None or (x, y, w, h)")
+        if int(i_bin) != i_bin or i_bin < 1:
+            raise ValueError("Wrong input: i_bin must be positive integer")
         self.t_file_names = t_file_names
+        self.b_use_index = b_use_index
         self.df_info = pandas.DataFrame( \
             index = np.arange(len(self.t_file_names)), \
             columns = ['file_name', 'start', 'end', 'duration', 'frames', 'frame_rate', 'width', 'height', 'format'] \
         )
-        self.t_vid_files   = None
-        self.t_vid_streams = None
         self.na_ends  = None # [1000, 2000, 3000, 4000, 4963], read only!
         self.na_frame = None # the frame (as Numpy array)
         self.i_curr_file_idx  = 0     # read only!
         self.i_curr_rel_frame_num = 0 # read only!
         self.i_curr_abs_frame_num = 0 # read only!
         self.i_next_abs_frame_num = 0 # read only!
+        self.i_step = 1 # read only! see set_step()
+        # True if the last read_*_into() call decoded the frame directly into
+        # the output array, False if the frame had to be copied into it
+        self.b_copy_avoided = False # read only!
         # For convenience only. Calculated from self.df_info
         # Note that instead of self.dtype we use self.na_frame.dtype
         self.shape = None
         self.t_frame_hw = None
         self.i_nframes = None
+        # background frame prefetching, disabled if i_prefetch_depth == 0
+        self.i_prefetch_depth = int(i_prefetch_depth)
+        self._oc_prefetch_queue  = None
+        self._oc_prefetch_stop   = None
+        self._oc_prefetch_thread = None
+        # (shape, dtype) of a single frame as returned by _decode_frame()
+        self._t_frame_spec = None
+        # LRU pool of open files, file_idx -> tuple of handles returned by _open_part()
+        self.i_max_open_files = i_max_open_files
+        self.i_preopen_margin = 64 # open the next file when so many frames left in the current one
+        self._od_parts = collections.OrderedDict()
+        self._oc_parts_lock = threading.RLock()
+        self._oc_preopen_thread = None
+        self._i_preopen_idx = -1
+        # LRU cache of decoded frames, abs_frame_num -> na_frame, disabled if i_cache_bytes == 0
+        self.i_cache_bytes = int(i_cache_bytes)
+        self.i_cache_used_bytes = 0 # read only!
+        self.i_cache_hits   = 0     # read only!
+        self.i_cache_misses = 0     # read only!
+        self._od_frame_cache = collections.OrderedDict()
+        # crop window (x, y, w, h) and binning factor
+        self.t_crop = None if t_crop is None else tuple(int(i_val) for i_val in t_crop)
+        self.i_bin = int(i_bin)
+        self._t_window = None # (y, x, h, w) of the full frame to be cropped, None if nothing to do
+    #
+    @property
+    def t_vid_files(self):
+        """
+        Tuple of file handles, one per file. All files are opened, so
+        this should not be used together with i_max_open_files.
+        """
+        return tuple(self._get_part(idx)[0] for idx in range(len(self.t_file_names)))
+    #
+    @property
+    def t_vid_streams(self):
+        """
+        Tuple of video stream handles, one per file. All files are opened, so
+        this should not be used together with i_max_open_files.
+        """
+        return tuple(self._get_part(idx)[1] for idx in range(len(self.t_file_names)))
+    #
+    def _open_part(self, file_idx):
+        """
+        Open the file file_idx and return tuple of its handles: (file, stream, ...)
+        Must be implemented by backends. Can be called from the background thread.
+        """
+        raise NotImplementedError("To be implemented by backend")
+    #
+    def _close_part(self, file_idx, t_part):
+        """
+        Close handles previously returned by _open_part().
+        Must be implemented by backends.
+        """
+        raise NotImplementedError("To be implemented by backend")
+    #
+    def _probe_part(self, file_idx, t_part):
+        """
+        Return dictionary of information (frames, frame_rate, width, height,
+        format and any backend-specific data) about the opened file file_idx.
+        Must be implemented by backends.
+        """
+        raise NotImplementedError("To be implemented by backend")
+    #
+    def _init_parts(self, s_backend, t_required_keys=()):
+        """
+        Return list of per-file dictionaries (see _probe_part()) taken from
+        sidecar indices. Files without (or with incomplete) index are opened
+        and probed, the rest of files remain closed until they are needed.
+        """
+        l_info = []
+        for idx in range(len(self.t_file_names)):
+            d_index = _load_index(self.t_file_names[idx], s_backend) if self.b_use_index else None
+            if d_index is None or not all(s_key in d_index for s_key in t_required_keys):
+                d_index = self._probe_part(idx, self._get_part(idx))
+                if self.b_use_index: _save_index(self.t_file_names[idx], s_backend, d_index)
+            l_info.append(d_index)
+        return l_info
+    #
+    def _get_part(self, file_idx):
+        """
+        Return tuple of handles of the file file_idx, open the file if necessary.
+        If there are more than i_max_open_files open, the least recently used
+        files are closed.
+        """
+        with self._oc_parts_lock:
+            if file_idx in self._od_parts:
+                self._od_parts.move_to_end(file_idx)
+                return self._od_parts[file_idx]
+            oc_preopen_thread = self._oc_preopen_thread if self._i_preopen_idx == file_idx else None
+        # the file may be being opened by the background thread right now
+        if oc_preopen_thread is not None and oc_preopen_thread is not threading.current_thread():
+            oc_preopen_thread.join()
+            with self._oc_parts_lock:
+                if file_idx in self._od_parts:
+                    self._od_parts.move_to_end(file_idx)
+                    return self._od_parts[file_idx]
+        # opening may take a while, so it is done outside of the lock
+        t_part = self._open_part(file_idx)
+        l_evicted = []
+        with self._oc_parts_lock:
+            if file_idx in self._od_parts:
+                l_evicted.append((file_idx, t_part))
+                t_part = self._od_parts[file_idx]
+                self._od_parts.move_to_end(file_idx)
+            else:
+                self._od_parts[file_idx] = t_part
+            if self.i_max_open_files is not None:
+                while len(self._od_parts) > self.i_max_open_files:
+                    l_evicted.append(self._od_parts.popitem(last=False))
+        for evicted_idx, t_evicted in l_evicted:
+            self._close_part(evicted_idx, t_evicted)
+        return t_part
+    #
+    @staticmethod
+    def _preopen_worker(wr_movie, file_idx):
+        oc_movie = wr_movie()
+        if oc_movie is None: return
+        try:
+            oc_movie._get_part(file_idx)
+        except Exception:
+            pass # the error is raised again when a frame is actually read from this file
+    #
+    def _preopen_next(self, file_idx, frame_num):
+        """
+        Start opening of the file next to file_idx in the background
+        if frame_num is close to the end of the file file_idx.
+        """
+        next_idx = file_idx + 1
+        if next_idx >= len(self.t_file_names): return
+        if self.na_ends[file_idx] - self.rel2abs(file_idx, frame_num) > self.i_preopen_margin: return
+        with self._oc_parts_lock:
+            if next_idx in self._od_parts: return
+            if self._oc_preopen_thread is not None and self._oc_preopen_thread.is_alive(): return
+            self._i_preopen_idx = next_idx
+            self._oc_preopen_thread = threading.Thread( \
+                target=CMuPaMovie._preopen_worker, \
+                args=(weakref.ref(self), next_idx), \
+                daemon=True \
+            )
+            self._oc_preopen_thread.start()
+    #
+    def _close_parts(self):
+        """
+        Wait for the background opening (if any) and close all open files.
+        """
+        if self._oc_preopen_thread is not None:
+            self._oc_preopen_thread.join()
+            self._oc_preopen_thread = None
+            self._i_preopen_idx = -1
+        with self._oc_parts_lock:
+            l_parts = list(self._od_parts.items())
+            self._od_parts.clear()
+        for file_idx, t_part in l_parts:
+            self._close_part(file_idx, t_part)
+    #
+    def _init_info(self, l_info, b_verbose=False):
+        """
+        Build self.df_info and all derived attributes from a list of
+        per-file dictionaries (frames, frame_rate, width, height, format).
+        """
+        self.df_info = pandas.DataFrame(l_info, \
+            index = np.arange(len(self.t_file_names)), \
+            columns = ['frames', 'frame_rate', 'width', 'height', 'format'] \
+        )
+        self.df_info.insert(0, 'file_name', list(self.t_file_names))
+        self.df_info.insert(1, 'duration', self.df_info['frames'])
+        self.df_info.insert(1, 'end',   self.df_info['duration'].cumsum())
+        self.df_info.insert(1, 'start', self.df_info['end'] - self.df_info['duration'])
+
+        # check if all video files have the same frame width and height
+        if (self.df_info['width'] != self.df_info['width'][0]).any():
+            raise ValueError("Frame width is not consistent across input video files")
+        if (self.df_info['height'] != self.df_info['height'][0]).any():
+            raise ValueError("Frame height is not consistent across input video files")
+
+        # [1000, 2000, 3000, 4000, 4963], read only!
+        self.na_ends = np.array(self.df_info['end'], dtype=np.int64)
+
+        self.i_nframes = int(self.na_ends[-1])
+        self.t_frame_hw = (int(self.df_info['height'][0]), int(self.df_info['width'][0]))
+
+        if self.t_crop is not None or self.i_bin > 1:
+            i_frame_h, i_frame_w = self.t_frame_hw
+            i_x, i_y, i_w, i_h = self.t_crop if self.t_crop is not None else (0, 0, i_frame_w, i_frame_h)
+            if i_x < 0 or i_y < 0 or i_x + i_w > i_frame_w or i_y + i_h > i_frame_h:
+                raise ValueError("Crop window %s is out of the frame %s" % (repr(self.t_crop), repr(self.t_frame_hw)))
+            if i_w < self.i_bin or i_h < self.i_bin:
+                raise ValueError("Crop window %s is too small for binning by %d" % (repr(self.t_crop), self.i_bin))
+            # incomplete blocks at the right and bottom edges are dropped
+            self._t_window = (i_y, i_x, i_h // self.i_bin * self.i_bin, i_w // self.i_bin * self.i_bin)
+            self.t_frame_hw = (i_h // self.i_bin, i_w // self.i_bin)
+
+        self.shape = self.t_frame_hw + (self.i_nframes,)
+
+        if b_verbose:
+            print(self.df_info)
     #
     def abs2rel(self, i_abs):
         # if requested i_abs is before the start - return (first_file, first_frame)
         if i_abs < 0: return (0,0)
         # if requested i_abs is after the end - return (last_file, last_frame)
-        if i_abs >= self.na_ends[-1]: return ( self.na_ends.shape[0] - 1, self.na_ends[-1] - 1 )
-        # find an index of the first edge bigger than requested i_abs
-        i_1st_bigger_edge = np.argmax(self.na_ends > i_abs)
+        if i_abs >= self.na_ends[-1]: i_abs = int(self.na_ends[-1]) - 1
+        # find an index of the first edge bigger than requested i_abs (binary search)
+        i_1st_bigger_edge = int(np.searchsorted(self.na_ends, i_abs, side='right'))
         # if requested i_abs is within the first bin - return it as is
         if i_1st_bigger_edge == 0:
-            return (0, i_abs)
+            return (0, int(i_abs))
         else:
-            return (i_1st_bigger_edge, i_abs - self.na_ends[i_1st_bigger_edge - 1])
+            return (i_1st_bigger_edge, int(i_abs - self.na_ends[i_1st_bigger_edge - 1]))
         #
     #
     def rel2abs(self, file_idx, frame_num):
         if file_idx < 0: return 0
-        if file_idx == 0: return frame_num
-        if file_idx >= self.na_ends.shape[0]: return self.na_ends[-1] - 1
+        if file_idx == 0: return int(frame_num)
+        if file_idx >= self.na_ends.shape[0]: return int(self.na_ends[-1]) - 1
         if frame_num >= self.na_ends[file_idx]:
             raise ValueError("Wrong input: %s" % repr((file_idx, frame_num)) )
         #
         # i_abs, absolute frame number 0 ~ self.na_ends[-1]
-        return self.na_ends[file_idx - 1] + frame_num
+        return int(self.na_ends[file_idx - 1] + frame_num)
+    #
+    def _crop_frame(self, na_frame):
+        """
+        Return view of the crop window of the full frame.
+        """
+        if self._t_window is None: return na_frame
+        i_y, i_x, i_h, i_w = self._t_window
+        return na_frame[i_y:i_y + i_h, i_x:i_x + i_w]
+    #
+    def _bin_frame(self, na_frame, na_out=None):
+        """
+        Bin already cropped frame into na_out (new array if na_out is None).
+        """
+        if self.i_bin == 1:
+            if na_out is None: return na_frame.copy()
+            np.copyto(na_out, na_frame)
+            return na_out
+        # INTER_AREA with an integer scale factor is exactly the block average
+        return cv.resize(na_frame, (self.t_frame_hw[1], self.t_frame_hw[0]), dst=na_out, interpolation=cv.INTER_AREA)
+    #
+    def _window_frame(self, na_frame):
+        """
+        Return cropped and binned copy of the full frame, or the frame itself
+        if neither crop nor binning were requested.
+        """
+        if self._t_window is None: return na_frame
+        return self._bin_frame(self._crop_frame(na_frame))
+    #
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        """
+        Decode single frame (addressed by file index and relative frame number)
+        and return it (cropped and binned, see _window_frame()) as Numpy array,
+        or None in case of failure.
+        Must be implemented by backends. Must not change any attribute visible
+        to the user since it can be called from the prefetching thread.
+        """
+        raise NotImplementedError("To be implemented by backend")
+    #
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        """
+        Decode single frame into the na_out array. Return True if the frame was
+        decoded directly into na_out, False if it was copied there from
+        a temporary array or None in case of failure.
+        Backends can override this by decoding into na_out natively.
+        """
+        na_frame = self._decode_frame(file_idx, frame_num, b_do_seek=b_do_seek)
+        if na_frame is None: return None
+        np.copyto(na_out, na_frame)
+        return False
+    #
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        """
+        Decode i_count consecutive frames of a single file starting from the
+        relative frame number frame_num into the na_out (T x H x W) array.
+        Backends can override this by native multi-frame reading.
+        """
+        for tt in range(i_count):
+            na_frame = self._decode_frame(file_idx, frame_num + tt, b_do_seek=(tt == 0))
+            if na_frame is None:
+                raise IOError("Unable to read frame %d from: %s" % (frame_num + tt, self.t_file_names[file_idx]))
+            na_out[tt] = na_frame
+    #
+    def _get_frame_spec(self):
+        """
+        Return (shape, dtype) of a single frame.
+        The very first frame of the movie is decoded once to find out.
+        """
+        if self._t_frame_spec is None:
+            self._stop_prefetch() # the frame 0 is going to be decoded by this thread
+            na_frame = self._decode_frame(0, 0, b_do_seek=True)
+            if na_frame is None:
+                raise IOError("Unable to read frame 0 from: %s" % self.t_file_names[0])
+            self._t_frame_spec = (na_frame.shape, na_frame.dtype)
+        return self._t_frame_spec
+    #
+    def _check_out_frame(self, na_out):
+        t_frame_shape, frame_dtype = self._get_frame_spec()
+        if na_out.shape != tuple(t_frame_shape) or na_out.dtype != frame_dtype or not na_out.flags.c_contiguous:
+            raise ValueError("Unexpected shape, dtype or layout of the output array: %s %s" % (repr(na_out.shape), na_out.dtype))
+    #
+    def _update_curr_frame(self, na_frame, file_idx, frame_num):
+        self.na_frame = na_frame
+        self.i_curr_file_idx = file_idx
+        self.i_curr_rel_frame_num = frame_num
+        self.i_curr_abs_frame_num = self.rel2abs(self.i_curr_file_idx, self.i_curr_rel_frame_num)
+    #
+    def _cache_get(self, abs_frame_num):
+        na_frame = self._od_frame_cache.get(abs_frame_num)
+        if na_frame is None:
+            self.i_cache_misses += 1
+        else:
+            self.i_cache_hits += 1
+            self._od_frame_cache.move_to_end(abs_frame_num)
+        return na_frame
+    #
+    def _cache_put(self, abs_frame_num, na_frame):
+        if na_frame.nbytes > self.i_cache_bytes: return
+        if abs_frame_num in self._od_frame_cache: return
+        # the cached frame is shared with the user, prevent its modification
+        na_frame.flags.writeable = False
+        self._od_frame_cache[abs_frame_num] = na_frame
+        self.i_cache_used_bytes += na_frame.nbytes
+        while self.i_cache_used_bytes > self.i_cache_bytes:
+            _, na_dropped = self._od_frame_cache.popitem(last=False)
+            self.i_cache_used_bytes -= na_dropped.nbytes
+    #
+    def clear_cache(self):
+        """
+        Drop all cached frames and reset cache hit/miss counters.
+        """
+        self._od_frame_cache.clear()
+        self.i_cache_used_bytes = 0
+        self.i_cache_hits   = 0
+        self.i_cache_misses = 0
+    #
+    def _read_frame(self, file_idx, frame_num, b_do_seek=True):
+        na_frame = None
+        if self.i_cache_bytes > 0:
+            abs_frame_num = self.rel2abs(file_idx, frame_num)
+            na_frame = self._cache_get(abs_frame_num)
+        if na_frame is None:
+            self._preopen_next(file_idx, frame_num)
+            na_frame = self._decode_frame(file_idx, frame_num, b_do_seek=b_do_seek)
+            if na_frame is None:
+                return False
+            if self.i_cache_bytes > 0: self._cache_put(abs_frame_num, na_frame)
+        self._update_curr_frame(na_frame, file_idx, frame_num)
+        return True
+    #
+    def _read_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        na_frame = None
+        if self.i_cache_bytes > 0:
+            na_frame = self._cache_get(self.rel2abs(file_idx, frame_num))
+        if na_frame is not None:
+            np.copyto(na_out, na_frame)
+            self.b_copy_avoided = False
+        else:
+            # frames decoded into the caller's array are not cached
+            self._preopen_next(file_idx, frame_num)
+            b_direct = self._decode_frame_into(file_idx, frame_num, na_out, b_do_seek=b_do_seek)
+            if b_direct is None:
+                return False
+            self.b_copy_avoided = b_direct
+        self._update_curr_frame(na_out, file_idx, frame_num)
+        return True
+    #
+    @staticmethod
+    def _prefetch_worker(wr_movie, i_abs_start, i_step, oc_queue, oc_stop):
+        """
+        Body of the prefetching thread. Only a weak reference to the movie
+        object is kept between frames, so the thread quits by itself
+        when the movie object is garbage collected.
+        """
+        def put_or_quit(t_item):
+            while not oc_stop.is_set() and wr_movie() is not None:
+                try:
+                    oc_queue.put(t_item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        #
+        b_do_seek = True # the stream position may be anywhere at this point
+        i_abs = i_abs_start
+        while not oc_stop.is_set():
+            oc_movie = wr_movie()
+            if oc_movie is None or i_abs >= oc_movie.na_ends[-1]:
+                put_or_quit((i_abs, 0, 0, None))
+                return
+            rel_file_idx, rel_frame_num = oc_movie.abs2rel(i_abs)
+            try:
+                oc_movie._preopen_next(rel_file_idx, rel_frame_num)
+                na_frame = oc_movie._decode_frame(rel_file_idx, rel_frame_num, b_do_seek=b_do_seek)
+            except Exception as e:
+                na_frame = e
+            del oc_movie
+            if not put_or_quit((i_abs, rel_file_idx, rel_frame_num, na_frame)): return
+            if not isinstance(na_frame, np.ndarray): return
+            b_do_seek = False
+            i_abs += i_step
+        #
+    #
+    def _start_prefetch(self):
+        self._oc_prefetch_queue = queue.Queue(maxsize=self.i_prefetch_depth)
+        self._oc_prefetch_stop = threading.Event()
+        self._oc_prefetch_thread = threading.Thread( \
+            target=CMuPaMovie._prefetch_worker, \
+            args=(weakref.ref(self), self.i_next_abs_frame_num, self.i_step, self._oc_prefetch_queue, self._oc_prefetch_stop), \
+            daemon=True \
+        )
+        self._oc_prefetch_thread.start()
+    #
+    def _stop_prefetch(self):
+        """
+        Stop the prefetching thread (if any) and drop all prefetched frames.
+        Must be called before any direct access to the video streams.
+        """
+        if self._oc_prefetch_thread is None: return
+        self._oc_prefetch_stop.set()
+        self._oc_prefetch_thread.join()
+        self._oc_prefetch_queue  = None
+        self._oc_prefetch_stop   = None
+        self._oc_prefetch_thread = None
+    #
+    def _read_next_prefetched(self):
+        if self._oc_prefetch_thread is None:
+            self._start_prefetch()
+        i_abs, rel_file_idx, rel_frame_num, na_frame = self._oc_prefetch_queue.get()
+        if not isinstance(na_frame, np.ndarray):
+            self._stop_prefetch()
+            if isinstance(na_frame, Exception): raise na_frame
+            return False
+        if i_abs != self.i_next_abs_frame_num:
+            raise RuntimeError("Prefetched frame out of order: %d != %d" % (i_abs, self.i_next_abs_frame_num))
+        if self.i_cache_bytes > 0: self._cache_put(i_abs, na_frame)
+        self._update_curr_frame(na_frame, rel_file_idx, rel_frame_num)
+        return True
+    #
+    def seek(self, abs_frame_num):
+        """
+        Set current position, so the next call of read_next_frame()
+        will read the frame number abs_frame_num.
+        Return False if requested frame number is out of range.
+        """
+        if abs_frame_num < 0 or abs_frame_num >= self.na_ends[-1]:
+            return False
+        self._stop_prefetch()
+        self.i_next_abs_frame_num = int(abs_frame_num)
+        return True
+    #
+    def set_step(self, i_step):
+        """
+        Make read_next_frame() to read every i_step-th frame.
+        Skipped frames are not decoded (TIFF pages and ZIP members are not
+        read at all, OpenCV streams grab() them or seek if that is cheaper).
+        """
+        if int(i_step) != i_step or i_step < 1:
+            raise ValueError("Wrong input: i_step must be positive integer")
+        self._stop_prefetch()
+        self.i_step = int(i_step)
+    #
+    def read_next_frame(self):
+        """
+        Read next frame at the current position.
+        This method is fast.
+        You can set current position once by using seek(frame_number).
+        The current position is advanced by self.i_step, see set_step().
+        """
+        if self.i_next_abs_frame_num >= self.na_ends[-1]:
+            return False
+        if self.i_prefetch_depth > 0:
+            b_ret = self._read_next_prefetched()
+        else:
+            rel_file_idx, rel_frame_num = self.abs2rel(self.i_next_abs_frame_num)
+            b_ret = self._read_frame(rel_file_idx, rel_frame_num, b_do_seek=False)
+        if b_ret is True:
+            self.i_next_abs_frame_num += self.i_step
+        return b_ret
+    #
+    def read_next_frame_into(self, na_out):
+        """
+        Same as read_next_frame() but the frame is written into the pre-allocated
+        (C-contiguous) na_out array, which becomes the self.na_frame.
+        The self.b_copy_avoided tells if the frame was decoded directly into
+        the na_out (prefetched and cached frames are always copied).
+        """
+        if self.i_next_abs_frame_num >= self.na_ends[-1]:
+            return False
+        self._check_out_frame(na_out)
+        if self.i_prefetch_depth > 0:
+            b_ret = self._read_next_prefetched()
+            if b_ret is True:
+                np.copyto(na_out, self.na_frame)
+                self.na_frame = na_out
+                self.b_copy_avoided = False
+        else:
+            rel_file_idx, rel_frame_num = self.abs2rel(self.i_next_abs_frame_num)
+            b_ret = self._read_frame_into(rel_file_idx, rel_frame_num, na_out, b_do_seek=False)
+        if b_ret is True:
+            self.i_next_abs_frame_num += self.i_step
+        return b_ret
+    #
+    def read_frame(self, abs_frame_num):
+        """
+        Read particular frame number into self.na_frame
+        The current position is set to the frame next to the abs_frame_num.
+        Return False if requested frame number is out of range.
+        """
+        if abs_frame_num < 0 or abs_frame_num >= self.na_ends[-1]:
+            return False
+        self._stop_prefetch()
+        rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
+        b_ret = self._read_frame(rel_file_idx, rel_frame_num)
+        if b_ret is True:
+            self.i_next_abs_frame_num = int(abs_frame_num) + 1
+        return b_ret
+    #
+    def read_frame_into(self, abs_frame_num, na_out):
+        """
+        Read particular frame number into the pre-allocated (C-contiguous) na_out
+        array, which becomes the self.na_frame. The current position is set to
+        the frame next to the abs_frame_num. See read_next_frame_into() for details.
+        Return False if requested frame number is out of range.
+        """
+        if abs_frame_num < 0 or abs_frame_num >= self.na_ends[-1]:
+            return False
+        self._stop_prefetch()
+        self._check_out_frame(na_out)
+        rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
+        b_ret = self._read_frame_into(rel_file_idx, rel_frame_num, na_out, b_do_seek=True)
+        if b_ret is True:
+            self.i_next_abs_frame_num = int(abs_frame_num) + 1
+        return b_ret
+    #
+    def read_frames(self, i_start, i_count, na_out=None):
+        """
+        Read block of i_count consecutive frames starting from the absolute
+        frame number i_start and return it as (T x H x W) Numpy array.
+        The block can span across file boundaries. If na_out is provided,
+        frames are written into it and na_out is returned.
+        The current position is set to the frame next to the block,
+        the self.na_frame is not changed. Frames of the block are not cached.
+        """
+        i_start = int(i_start)
+        i_count = int(i_count)
+        if i_start < 0 or i_count < 0 or i_start + i_count > self.na_ends[-1]:
+            raise ValueError("Wrong input: %s" % repr((i_start, i_count)))
+
+        self._stop_prefetch()
+        t_frame_shape, frame_dtype = self._get_frame_spec()
+        if na_out is None:
+            na_out = np.empty((i_count,) + tuple(t_frame_shape), dtype=frame_dtype)
+        elif na_out.shape != (i_count,) + tuple(t_frame_shape):
+            raise ValueError("Unexpected shape of the output array: %s" % repr(na_out.shape))
+
+        i_abs = i_start
+        while i_abs < i_start + i_count:
+            rel_file_idx, rel_frame_num = self.abs2rel(i_abs)
+            # number of frames to read from this file
+            i_nframes = min(int(self.na_ends[rel_file_idx]) - i_abs, i_start + i_count - i_abs)
+            self._preopen_next(rel_file_idx, rel_frame_num + i_nframes - 1)
+            self._decode_block(rel_file_idx, rel_frame_num, i_nframes, \
+                na_out[i_abs - i_start : i_abs - i_start + i_nframes])
+            i_abs += i_nframes
+
+        self.i_next_abs_frame_num = i_start + i_count
+        return na_out
+    #
+    def __getitem__(self, key):
+        """
+        Return lazy view (CMuPaMovieView) of frames and pixels selected by the
+        NumPy-style key, the movie is indexed as (T x H x W) array returned by
+        the read_frames(). Nothing is read until the view is materialized.
+        """
+        return CMuPaMovieView(self, key)
+    #
+    def close(self):
+        """
+        Stop any background activity related to this object and close all files.
+        Files are re-opened if reading continues after this call.
+        """
+        self._stop_prefetch()
+        self._close_parts()
+    #
+    def get_frame_stat(self):
+        return "curr_abs_frame_num: %d\t curr_file_idx: %d\t curr_rel_frame_num: %d" % ( \
+            self.i_curr_abs_frame_num, \
+            self.i_curr_file_idx, \
+            self.i_curr_rel_frame_num \
+        )
+    #
+    def get_cache_stat(self):
+        return "cache_hits: %d\t cache_misses: %d\t cached_frames: %d\t cache_used_bytes: %d" % ( \
+            self.i_cache_hits, \
+            self.i_cache_misses, \
+            len(self._od_frame_cache), \
+            self.i_cache_used_bytes \
+        )
     #
 #
 
+class CMuPaMovieView(object):
+    """
+    Lazy view of frames and pixels of a MultiPart Movie, see CMuPaMovie.__getitem__()
+    The first item of the key selects frames (integer, slice, array of integers
+    or booleans), the rest of the key selects pixels of each frame.
+    Nothing is read until the view is materialized by asarray() or np.asarray().
+    Then each of the selected frames is read once, in temporal order: runs of
+    consecutive frames as blocks (see CMuPaMovie.read_frames()) of up to
+    i_chunk_size frames, other frames one by one. Only the selected pixels
+    of each block are kept. The position and the na_frame of the movie
+    are not changed.
+    """
+    def __init__(self, oc_movie, key, i_chunk_size=64):
+        t_key = key if isinstance(key, tuple) else (key,)
+        if len(t_key) == 0: t_key = (slice(None),)
+        self.oc_movie = oc_movie
+        self.i_chunk_size = int(i_chunk_size)
+        self.b_single_frame = False
+        key_t = t_key[0]
+        self.t_pixel_key = t_key[1:]
+        i_nframes = oc_movie.i_nframes
+        if key_t is Ellipsis:
+            self.na_frame_nums = np.arange(i_nframes, dtype=np.int64)
+            self.t_pixel_key = t_key
+        elif isinstance(key_t, (int, np.integer)):
+            i_frame_num = int(key_t) + i_nframes if key_t < 0 else int(key_t)
+            if i_frame_num < 0 or i_frame_num >= i_nframes:
+                raise IndexError("Frame index %d is out of range of %d frames" % (key_t, i_nframes))
+            self.na_frame_nums = np.array([i_frame_num], dtype=np.int64)
+            self.b_single_frame = True
+        elif isinstance(key_t, slice):
+            self.na_frame_nums = np.arange(*key_t.indices(i_nframes), dtype=np.int64)
+        else:
+            na_key = np.asarray(key_t)
+            if na_key.dtype == bool:
+                if na_key.shape != (i_nframes,):
+                    raise IndexError("Boolean frame index of shape %s does not match %d frames" % (repr(na_key.shape), i_nframes))
+                self.na_frame_nums = np.flatnonzero(na_key).astype(np.int64)
+            elif np.issubdtype(na_key.dtype, np.integer) and na_key.ndim == 1:
+                self.na_frame_nums = np.where(na_key < 0, na_key + i_nframes, na_key).astype(np.int64)
+                if (self.na_frame_nums < 0).any() or (self.na_frame_nums >= i_nframes).any():
+                    raise IndexError("Frame index is out of range of %d frames" % i_nframes)
+            else:
+                raise IndexError("Unsupported frame index: %s" % repr(key_t))
+        self._t_pixel_shape = None
+    #
+    def _get_pixel_shape(self):
+        """
+        Return shape of the selected pixels of a single frame.
+        """
+        if self._t_pixel_shape is None:
+            t_frame_shape, frame_dtype = self.oc_movie._get_frame_spec()
+            # no memory is allocated for the fake frame
+            na_fake = np.broadcast_to(np.zeros((), dtype=frame_dtype), (1,) + tuple(t_frame_shape))
+            self._t_pixel_shape = na_fake[(slice(None),) + self.t_pixel_key].shape[1:]
+        return self._t_pixel_shape
+    #
+    @property
+    def shape(self):
+        if self.b_single_frame: return self._get_pixel_shape()
+        return (self.na_frame_nums.shape[0],) + self._get_pixel_shape()
+    #
+    @property
+    def dtype(self):
+        return self.oc_movie._get_frame_spec()[1]
+    #
+    def __len__(self):
+        return self.shape[0]
+    #
+    def asarray(self):
+        """
+        Read the selected frames and return the selected pixels as Numpy array.
+        """
+        oc_movie = self.oc_movie
+        t_frame_shape, frame_dtype = oc_movie._get_frame_spec()
+        t_pixel_shape = self._get_pixel_shape()
+        na_frame_nums, na_inverse = np.unique(self.na_frame_nums, return_inverse=True)
+        na_out = np.empty((na_frame_nums.shape[0],) + t_pixel_shape, dtype=frame_dtype)
+        b_all_pixels = len(self.t_pixel_key) == 0
+        t_pixel_key = (slice(None),) + self.t_pixel_key
+        if not b_all_pixels:
+            na_buf = np.empty((min(self.i_chunk_size, na_frame_nums.shape[0]),) + tuple(t_frame_shape), dtype=frame_dtype)
+        # runs of consecutive frame numbers
+        na_run_starts = np.flatnonzero(np.diff(na_frame_nums, prepend=na_frame_nums[:1] - 2) != 1)
+        na_run_ends = np.append(na_run_starts[1:], na_frame_nums.shape[0])
+
+        t_state = (oc_movie.na_frame, oc_movie.i_curr_file_idx, oc_movie.i_curr_rel_frame_num, \
+            oc_movie.i_curr_abs_frame_num, oc_movie.i_next_abs_frame_num)
+        try:
+            for i_run_start, i_run_end in zip(na_run_starts, na_run_ends):
+                for i0 in range(i_run_start, i_run_end, self.i_chunk_size):
+                    i1 = min(i0 + self.i_chunk_size, i_run_end)
+                    na_block = na_out[i0:i1] if b_all_pixels else na_buf[:i1 - i0]
+                    if i1 - i0 == 1:
+                        if not oc_movie.read_frame_into(int(na_frame_nums[i0]), na_block[0]):
+                            raise IOError("Unable to read frame %d" % na_frame_nums[i0])
+                    else:
+                        oc_movie.read_frames(int(na_frame_nums[i0]), i1 - i0, na_out=na_block)
+                    if not b_all_pixels:
+                        na_out[i0:i1] = na_block[t_pixel_key]
+        finally:
+            oc_movie.na_frame, oc_movie.i_curr_file_idx, oc_movie.i_curr_rel_frame_num, \
+                oc_movie.i_curr_abs_frame_num, oc_movie.i_next_abs_frame_num = t_state
+
+        # repeated or unordered frames
+        if na_frame_nums.shape[0] != self.na_frame_nums.shape[0] or (na_frame_nums != self.na_frame_nums).any():
+            na_out = na_out[na_inverse.reshape(-1)]
+        if self.b_single_frame:
+            return na_out[0]
+        return na_out
+    #
+    def __array__(self, dtype=None, copy=None):
+        na_out = np.asarray(self.asarray()) # a single pixel is returned as scalar
+        if dtype is not None:
+            na_out = na_out.astype(dtype, copy=False)
+        return na_out
+    #
+#
+
+
 class CMuPaMovieCV(CMuPaMovie):
     """
     Class represents a MultiPart Movie (OpenCV-based backend).
     The MultiPart Movie constructed from a tuple of video file names.
     The file names in the tuple must be in correct temporal order.
     For details refer to documentation for the base class CMuPaMovie()
+    Position of each video stream is tracked, so consecutive frames are
+    read without seeking and short forward jumps are done by grabbing
+    (not decoding fully) frames. If b_use_keyframes is True, keyframe
+    positions are scanned from AVI index (once, cached in the sidecar index
+    if b_use_index is True) so any forward jump not crossing a keyframe
+    is done by grabbing frames as well.
+    If b_grayscale is True, frames are returned as single-channel (H x W)
+    arrays (the first, blue channel) instead of (H x W x 3) BGR arrays.
     """
-    def __init__(self, t_file_names, b_verbose=False):
-        super().__init__(t_file_names)
-
-        # to be turned into tuples at the end of this constructor
-        l_vid_files = []
-        l_vid_streams = []
-
-        for idx in range(len(self.t_file_names)):
-            self.df_info.loc[idx, 'file_name'] = self.t_file_names[idx]
-
-            i_read_try_cnt = 0
-            hCap = self._get_video_capture(self.t_file_names[idx])
-            while not hCap.isOpened():
-                hCap = self._get_video_capture(self.t_file_names[idx])
-                cv.waitKey(1000)
-                # print("WARNING: waiting for the cv.VideoCapture()...")
-                i_read_try_cnt += 1
-                if i_read_try_cnt >= 10:
-                    raise ValueError("Unable to read frame from: %s" % self.t_file_names[idx])
-
-            self.df_info.loc[idx, 'duration'] = hCap.get(cv.CAP_PROP_FRAME_COUNT)
-            self.df_info.loc[idx, 'frames']   = int(hCap.get(cv.CAP_PROP_FRAME_COUNT))
-            self.df_info.loc[idx, 'frame_rate'] = float(hCap.get(cv.CAP_PROP_FPS))
-            self.df_info.loc[idx, 'width']  = int(hCap.get(cv.CAP_PROP_FRAME_WIDTH))
-            self.df_info.loc[idx, 'height'] = int(hCap.get(cv.CAP_PROP_FRAME_HEIGHT))
-            # self.df_info.loc[idx, 'format'] = hCap.get(cv.CAP_PROP_ ... )
-
-            l_vid_files.append( hCap )
-            l_vid_streams.append( hCap )
-
-        # check if all video files have the same frame width and height
-        if self.df_info['width'].sum() != \
-           self.df_info['width'][0] * len(self.df_info['width']):
-            raise ValueError("Frame width is not consistent across input video files")
-        if self.df_info['height'].sum() != \
-           self.df_info['height'][0] * len(self.df_info['height']):
-            raise ValueError("Frame height is not consistent across input video files")
-
-        self.df_info['start'] = self.df_info['duration'].cumsum() - self.df_info['duration']
-        self.df_info['end']   = self.df_info['duration'].cumsum()
-        # self.df_info = self.df_info.set_index(['file_name'], append = True)
-
-        # freeze lists into tuples
-        self.t_vid_files = tuple(l_vid_files)
-        self.t_vid_streams = tuple(l_vid_streams)
-
-        # [1000, 2000, 3000, 4000, 4963], read only!
-        self.na_ends = np.array(self.df_info['end'], dtype=np.int32)
-
-        self.shape = (int(self.df_info['height'][0]), int(self.df_info['width'][0]), int(self.df_info['duration'].cumsum().sum()))
-        self.t_frame_hw = (int(self.df_info['height'][0]), int(self.df_info['width'][0]))
-        self.i_nframes = int(self.df_info['duration'].cumsum().sum())
-
-        if b_verbose:
-            print(self.df_info)
+    def __init__(self, t_file_names, i_prefetch_depth=0, b_use_index=False, b_use_keyframes=False, b_grayscale=False, \
+                 i_max_open_files=None, i_cache_bytes=0, t_crop=None, i_bin=1, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        self.b_use_keyframes = b_use_keyframes
+        self.t_keyframes = None # one array of keyframe numbers per file (empty if unknown)
+        # forward jumps up to this number of frames are always done by grabbing frames
+        # (OpenCV's seek() itself steps back by 16 frames and decodes forward)
+        self.i_max_grab = 16
+        self.b_grayscale = b_grayscale
+        self._na_bgr_buf = None # BGR frame buffer re-used by cv.VideoCapture.read() if b_grayscale is True or cropping
+        # next frame number to be read from each stream (-1 if unknown or the file is closed)
+        self._l_stream_pos = [-1] * len(self.t_file_names)
+
+        l_info = self._init_parts('cv', ('keyframes',) if self.b_use_keyframes else ())
+
+        if self.b_use_keyframes:
+            l_keyframes = []
+            for d_index in l_info:
+                # an index which does not match the frame count is useless
+                if d_index['keyframes'].size == 0 or d_index['keyframes'][-1] >= d_index['frames']:
+                    l_keyframes.append( np.zeros(0, dtype=np.int64) )
+                else:
+                    l_keyframes.append( d_index['keyframes'] )
+            self.t_keyframes = tuple(l_keyframes)
+
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        i_read_try_cnt = 0
+        hCap = self._get_video_capture(self.t_file_names[file_idx])
+        while not hCap.isOpened():
+            hCap = self._get_video_capture(self.t_file_names[file_idx])
+            cv.waitKey(1000)
+            # print("WARNING: waiting for the cv.VideoCapture()...")
+            i_read_try_cnt += 1
+            if i_read_try_cnt >= 10:
+                raise ValueError("Unable to read frame from: %s" % self.t_file_names[file_idx])
+        self._l_stream_pos[file_idx] = 0
+        return (hCap, hCap)
+
+    def _close_part(self, file_idx, t_part):
+        self._l_stream_pos[file_idx] = -1
+        t_part[0].release()
+
+    def _probe_part(self, file_idx, t_part):
+        hCap = t_part[0]
+        d_index = {
+            'frames': int(hCap.get(cv.CAP_PROP_FRAME_COUNT)),
+            'frame_rate': float(hCap.get(cv.CAP_PROP_FPS)),
+            'width':  int(hCap.get(cv.CAP_PROP_FRAME_WIDTH)),
+            'height': int(hCap.get(cv.CAP_PROP_FRAME_HEIGHT)),
+            'format': '' # hCap.get(cv.CAP_PROP_ ... )
+        }
+        if self.b_use_keyframes:
+            d_index['keyframes'] = _scan_avi_keyframes(self.t_file_names[file_idx])
+        return d_index
 
     def _get_video_capture(self, s_file_name):
         if cv.__version__.startswith('3'):
@@ -155,66 +1084,107 @@ class CMuPaMovieCV(CMuPaMovie):
         b_ret = False
         if file_idx  >= len(self.t_file_names): return b_ret
         if frame_num >= self.df_info.at[file_idx, 'frames']: return b_ret
-        return self.t_vid_streams[file_idx].set(cv.CAP_PROP_POS_FRAMES, frame_num)
+        b_ret = self._get_part(file_idx)[1].set(cv.CAP_PROP_POS_FRAMES, frame_num)
+        self._l_stream_pos[file_idx] = frame_num if b_ret else -1
+        return b_ret
 
-    def _read_frame(self, file_idx, frame_num, b_do_seek=True):
-        b_ret = False
+    def _position_stream(self, file_idx, frame_num):
+        """
+        Make frame_num to be the next frame delivered by the video stream.
+        Seek only if the frame can not be reached by grabbing frames forward
+        cheaper than by seeking.
+        """
+        oc_stream = self._get_part(file_idx)[1]
+        i_pos = self._l_stream_pos[file_idx]
+        if i_pos == frame_num: return True
+        if 0 <= i_pos < frame_num:
+            b_grab = (frame_num - i_pos) <= self.i_max_grab
+            if not b_grab and self.t_keyframes is not None and self.t_keyframes[file_idx].size > 0:
+                na_keyframes = self.t_keyframes[file_idx]
+                # the nearest keyframe at or before the requested frame
+                i_keyframe = na_keyframes[np.searchsorted(na_keyframes, frame_num, side='right') - 1]
+                b_grab = i_keyframe <= i_pos
+            if b_grab:
+                while self._l_stream_pos[file_idx] < frame_num:
+                    if not oc_stream.grab(): break
+                    self._l_stream_pos[file_idx] += 1
+                if self._l_stream_pos[file_idx] == frame_num: return True
+        return self._seek_rel(file_idx, frame_num)
+
+    def _read_stream(self, file_idx, frame_num, na_image=None):
+        """
+        Read the frame frame_num from the video stream file_idx into the na_image
+        (if it is of suitable shape and type, otherwise into a new array).
+        Return the (BGR) frame or None in case of failure.
+        """
         # set position to read the requested frame from requested video file
-        if b_do_seek:
-            b_ret = self._seek_rel(file_idx, frame_num)
-            if not b_ret: return b_ret
+        if not self._position_stream(file_idx, frame_num): return None
 
         # try to read the frame
+        oc_stream = self._get_part(file_idx)[1]
         while True:
-            b_ret, self.na_frame = self.t_vid_streams[file_idx].read()
+            b_ret, na_frame = oc_stream.read(na_image)
             if b_ret:
-                self.i_curr_file_idx = file_idx
-                self.i_curr_rel_frame_num = frame_num
-                self.i_curr_abs_frame_num = self.rel2abs(self.i_curr_file_idx, self.i_curr_rel_frame_num)
-                return b_ret
+                self._l_stream_pos[file_idx] = frame_num + 1
+                return na_frame
             else:
                 # print("WARNING: waiting for the cv.read()...")
                 # cv.waitKey(1000)
-                b_ret = self._seek_rel(file_idx, frame_num)
-                if not b_ret: return b_ret
-
-        return b_ret
+                if not self._seek_rel(file_idx, frame_num): return None
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        if self.b_grayscale or self._t_window is not None:
+            # decode into the same buffer every time, only the extracted channel/window is new
+            na_bgr = self._read_stream(file_idx, frame_num, self._na_bgr_buf)
+            if na_bgr is None: return None
+            self._na_bgr_buf = na_bgr
+            if not self.b_grayscale:
+                return self._window_frame(na_bgr)
+            na_frame = cv.extractChannel(self._crop_frame(na_bgr), 0)
+            return self._bin_frame(na_frame) if self.i_bin > 1 else na_frame
+        return self._read_stream(file_idx, frame_num)
+
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        if self.b_grayscale or self._t_window is not None:
+            na_bgr = self._read_stream(file_idx, frame_num, self._na_bgr_buf)
+            if na_bgr is None: return None
+            self._na_bgr_buf = na_bgr
+            na_frame = self._crop_frame(na_bgr)
+            if self.b_grayscale:
+                if self.i_bin == 1:
+                    cv.extractChannel(na_frame, 0, dst=na_out)
+                    return True
+                na_frame = cv.extractChannel(na_frame, 0)
+            self._bin_frame(na_frame, na_out)
+            return True
+        na_frame = self._read_stream(file_idx, frame_num, na_out)
+        if na_frame is None: return None
+        if na_frame is na_out: return True
+        np.copyto(na_out, na_frame)
+        return False
 
     def seek(self, abs_frame_num):
         b_ret = False
+        if abs_frame_num < 0 or abs_frame_num >= self.na_ends[-1]:
+            return b_ret
+        self._stop_prefetch()
         rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
         if rel_file_idx  >= len(self.t_file_names): return b_ret
         if rel_frame_num >= self.df_info.at[rel_file_idx, 'frames']: return b_ret
-        return self.t_vid_streams[rel_file_idx].set(cv.CAP_PROP_POS_FRAMES, rel_frame_num)
+        b_ret = self._seek_rel(rel_file_idx, rel_frame_num)
+        if b_ret:
+            self.i_next_abs_frame_num = int(abs_frame_num)
+        return b_ret
 
     def read_frame(self, abs_frame_num):
         """
         Read particular frame number into self.na_frame
-        This method is slow because seek() is called every time.
+        The video stream is positioned as described in the class documentation,
+        so consecutive or nearby frames are read fast, others require seeking.
         """
+        self._stop_prefetch()
         rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
         return self._read_frame(rel_file_idx, rel_frame_num, b_do_seek=True)
-
-    def read_next_frame(self):
-        """
-        Read next frame at the current position.
-        This method is fast.
-        You can set current position once by using seek(frame_number).
-        """
-        rel_file_idx, rel_frame_num = self.abs2rel(self.i_next_abs_frame_num)
-        b_ret = self._read_frame(rel_file_idx, rel_frame_num, b_do_seek=False)
-        if b_ret is True:
-            self.i_next_abs_frame_num += 1
-            if self.i_next_abs_frame_num > self.na_ends[-1]:
-                b_ret = False
-        return b_ret
-
-    def get_frame_stat(self):
-        return "curr_abs_frame_num: %d\t curr_file_idx: %d\t curr_rel_frame_num: %d" % ( \
-            self.i_curr_abs_frame_num, \
-            self.i_curr_file_idx, \
-            self.i_curr_rel_frame_num \
-        )
     #
 #
 
@@ -225,239 +1195,901 @@ class CMuPaMovieTiff(CMuPaMovie):
     The MultiPart Movie constructed from a tuple of multi-page tiff file names.
     The file names in the tuple must be in correct temporal order.
     For details refer to documentation for the base class CMuPaMovie()
+    If b_use_mmap is True, uncompressed and contiguous pages are not decoded
+    but returned as read-only views (self.na_frame) into the memory-mapped
+    file. Compressed pages are read by the tifffile as usual.
+    If a crop window is requested, only strips (or tiles) of pages which
+    overlap the window are read and decoded.
+    If b_page_index is True, the chain of IFDs of each file is walked once
+    and only offsets of IFDs and of strips (or tiles) of pages are kept
+    (and stored in the sidecar index if b_use_index is True). Pages are
+    never iterated and cached by the tifffile, they are decoded by offset,
+    so memory use stays flat for BigTIFFs with millions of pages.
+    All pages are expected to be of the same shape and compression.
     """
-    def __init__(self, t_file_names, b_verbose=False):
-        super().__init__(t_file_names)
+    def __init__(self, t_file_names, b_use_mmap=False, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1, b_page_index=False, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        self.b_use_mmap = b_use_mmap
+        self.b_page_index = b_page_index
+        self.t_data_offsets = None # one array of page data offsets (or None) per file
+        # one array (or None) per file, used only if b_page_index is True
+        self.t_ifd_offsets = None
+        self.t_strip_offsets = None
+        self.t_strip_bytecounts = None
+
+        if self.b_page_index:
+            l_info = self._init_parts('tiff', ('ifd_offsets', 'strip_offsets', 'strip_bytecounts'))
+            self.t_ifd_offsets = tuple(d_index['ifd_offsets'] for d_index in l_info)
+            self.t_strip_offsets = tuple(d_index['strip_offsets'] for d_index in l_info)
+            self.t_strip_bytecounts = tuple(d_index['strip_bytecounts'] for d_index in l_info)
+        else:
+            l_info = self._init_parts('tiff')
+        self.t_data_offsets = tuple(d_index.get('data_offsets') for d_index in l_info)
 
-        # to be turned into tuples at the end of this constructor
-        l_vid_files = []
-        l_vid_streams = []
+        self._init_info(l_info, b_verbose=b_verbose)
 
-        for idx in range(len(self.t_file_names)):
-            self.df_info.loc[idx, 'file_name'] = self.t_file_names[idx]
-            oc_tiff_record = tifffile.TiffFile(self.t_file_names[idx])
-            if hasattr(oc_tiff_record, 'pages'):
-                oc_tiff = oc_tiff_record.pages
-            else:
-                oc_tiff = oc_tiff_record['pages']
-            oc_tmp_frame = oc_tiff[0]
-            # TODO we can use this later: print(oc_tmp_frame.tags)
-
-            self.df_info.loc[idx, 'duration'] = len(oc_tiff)
-            self.df_info.loc[idx, 'frames']   = len(oc_tiff)
-            # frame rate is not available in TIFFs: self.df_info.loc[idx, 'frame_rate'] =
-            self.df_info.loc[idx, 'width']  = int(oc_tmp_frame.shape[1]) # this is correct
-            self.df_info.loc[idx, 'height'] = int(oc_tmp_frame.shape[0])
-            self.df_info.loc[idx, 'format'] = oc_tmp_frame.dtype
+    @property
+    def t_mmaps(self):
+        """
+        Tuple of np.memmap (or None) objects, one per file. All files are opened,
+        so this should not be used together with i_max_open_files.
+        """
+        return tuple(self._get_part(idx)[2] for idx in range(len(self.t_file_names)))
 
-            l_vid_files.append( oc_tiff )
-            l_vid_streams.append( oc_tiff )
+    def _open_part(self, file_idx):
+        oc_tiff_record = tifffile.TiffFile(self.t_file_names[file_idx])
+        if hasattr(oc_tiff_record, 'pages'):
+            oc_tiff = oc_tiff_record.pages
+        else:
+            oc_tiff = oc_tiff_record['pages']
+        # map the whole file if at least the first page can be mapped
+        if self.b_use_mmap and getattr(oc_tiff[0], 'is_memmappable', False):
+            oc_mmap = np.memmap(self.t_file_names[file_idx], dtype=np.uint8, mode='r')
+        else:
+            oc_mmap = None
+        return (oc_tiff_record, oc_tiff, oc_mmap)
+
+    def _close_part(self, file_idx, t_part):
+        # the np.memmap is closed when the last view into it is released
+        t_part[0].close()
+
+    def _probe_part(self, file_idx, t_part):
+        oc_tiff = t_part[1]
+        oc_tmp_frame = oc_tiff[0]
+        # TODO we can use this later: print(oc_tmp_frame.tags)
+        d_index = {
+            'frames': 0,
+            'frame_rate': np.nan, # frame rate is not available in TIFFs
+            'width':  int(oc_tmp_frame.shape[1]), # this is correct
+            'height': int(oc_tmp_frame.shape[0]),
+            'format': str(oc_tmp_frame.dtype)
+        }
+        if self.b_page_index:
+            oc_fh = t_part[0].filehandle
+            with oc_fh.lock:
+                na_ifd_offsets, na_offsets, na_bytecounts = _walk_tiff_ifds(oc_fh)
+            d_index['frames'] = int(na_ifd_offsets.shape[0])
+            d_index['ifd_offsets'] = na_ifd_offsets
+            d_index['strip_offsets'] = na_offsets
+            d_index['strip_bytecounts'] = na_bytecounts
+            # pages of uncompressed contiguous strips can be memory-mapped as the first one
+            d_index['data_offsets'] = np.full(na_ifd_offsets.shape[0], -1, dtype=np.int64)
+            if oc_tmp_frame.is_memmappable:
+                na_mappable = \
+                    (na_bytecounts.sum(axis=1) == oc_tmp_frame.nbytes) & \
+                    (na_offsets[:, 0] % oc_tmp_frame.dtype.itemsize == 0) & \
+                    (na_offsets[:, 1:] == na_offsets[:, :-1] + na_bytecounts[:, :-1]).all(axis=1)
+                d_index['data_offsets'][na_mappable] = na_offsets[na_mappable, 0]
+            return d_index
+        d_index['frames'] = len(oc_tiff)
+        if self.b_use_index:
+            # byte offsets of IFDs and of image data (-1 if not memory-mappable) of each page
+            d_index['ifd_offsets']  = np.array([oc_page.offset for oc_page in oc_tiff], dtype=np.int64)
+            d_index['data_offsets'] = np.array( \
+                [oc_page.dataoffsets[0] if oc_page.is_memmappable else -1 for oc_page in oc_tiff], \
+                dtype=np.int64 \
+            )
+        return d_index
 
-        # check if all video files have the same frame width and height
-        if self.df_info['width'].sum() != \
-           self.df_info['width'][0] * len(self.df_info['width']):
-            raise ValueError("Frame width is not consistent across input video files")
-        if self.df_info['height'].sum() != \
-           self.df_info['height'][0] * len(self.df_info['height']):
-            raise ValueError("Frame height is not consistent across input video files")
+    def _get_page(self, file_idx, frame_num):
+        """
+        Return the TiffPage frame_num. If the page index is used, the page
+        is parsed from its IFD offset and is not cached by the tifffile.
+        """
+        oc_tiff_record, oc_pages, _ = self._get_part(file_idx)
+        if self.t_ifd_offsets is None:
+            return oc_pages[frame_num]
+        oc_fh = oc_tiff_record.filehandle
+        with oc_fh.lock:
+            oc_fh.seek(int(self.t_ifd_offsets[file_idx][frame_num]))
+            return tifffile.TiffPage(oc_tiff_record, index=frame_num)
+
+    def _get_page_chunks(self, file_idx, frame_num):
+        """
+        Return (page, offsets, bytecounts) of strips (or tiles) of the page frame_num.
+        If the page index is used, the page is not parsed at all, the first
+        page is returned instead (all pages are of the same layout).
+        """
+        if self.t_strip_offsets is None:
+            oc_page = self._get_part(file_idx)[1][frame_num]
+            return oc_page, oc_page.dataoffsets, oc_page.databytecounts
+        return self._get_part(file_idx)[1][0], \
+            self.t_strip_offsets[file_idx][frame_num], self.t_strip_bytecounts[file_idx][frame_num]
 
-        self.df_info['start'] = self.df_info['duration'].cumsum() - self.df_info['duration']
-        self.df_info['end']   = self.df_info['duration'].cumsum()
-        # self.df_info = self.df_info.set_index(['file_name'], append = True)
+    def _map_page(self, file_idx, frame_num):
+        """
+        Return read-only view of the image data of the page frame_num
+        directly from the memory-mapped file. No decoding, no copying.
+        Return None if the page is not memory-mappable (compressed etc.)
+        or its byte order is not native (the decoded frame is native).
+        The page is not even parsed if its data offset is known from the index.
+        """
+        oc_tiff_record, oc_pages, oc_mmap = self._get_part(file_idx)
+        if self.t_data_offsets[file_idx] is not None:
+            i_offset = int(self.t_data_offsets[file_idx][frame_num])
+            if i_offset < 0: return None
+            oc_page = oc_pages[0] # all pages expected to be of the same shape
+        else:
+            oc_page = self._get_page(file_idx, frame_num)
+            if not oc_page.is_memmappable: return None
+            i_offset = oc_page.dataoffsets[0]
+        dtype = np.dtype(oc_tiff_record.byteorder + oc_page.dtype.char)
+        if not dtype.isnative: return None
+        return np.ndarray(oc_page.shape, dtype=dtype, buffer=oc_mmap, offset=i_offset)
+
+    def _read_page_window(self, file_idx, frame_num, t_window=None):
+        """
+        Read and decode only those strips (or tiles) of the page frame_num which
+        overlap the t_window (y, x, h, w) and return view of the window.
+        The whole page is read if t_window is None.
+        Return None if the page layout is not supported or the whole page is
+        needed and the page index is not used (the tifffile reads it faster).
+        """
+        oc_fh = self._get_part(file_idx)[0].filehandle
+        oc_page, t_offsets, t_bytecounts = self._get_page_chunks(file_idx, frame_num)
+        if len(oc_page.shape) != 2 or len(oc_page.chunks) != 2 or len(oc_page.chunked) != 2: return None
+        i_y, i_x, i_h, i_w = t_window if t_window is not None else (0, 0) + tuple(oc_page.shape)
+        i_chunk_h, i_chunk_w = oc_page.chunks
+        i_y0, i_y1 = i_y // i_chunk_h, (i_y + i_h - 1) // i_chunk_h + 1
+        i_x0, i_x1 = i_x // i_chunk_w, (i_x + i_w - 1) // i_chunk_w + 1
+        if (i_y1 - i_y0) * (i_x1 - i_x0) == oc_page.chunked[0] * oc_page.chunked[1] and \
+           self.t_strip_offsets is None: return None
+
+        na_buf = np.zeros(((i_y1 - i_y0) * i_chunk_h, (i_x1 - i_x0) * i_chunk_w), dtype=oc_page.dtype.newbyteorder('='))
+        for yy in range(i_y0, i_y1):
+            for xx in range(i_x0, i_x1):
+                i_chunk = yy * oc_page.chunked[1] + xx
+                if t_bytecounts[i_chunk] == 0: continue # empty chunk, keep zeros
+                with oc_fh.lock:
+                    oc_fh.seek(int(t_offsets[i_chunk]))
+                    b_data = oc_fh.read(int(t_bytecounts[i_chunk]))
+                na_chunk = oc_page.decode(b_data, i_chunk, jpegtables=oc_page.jpegtables)[0]
+                # decoded chunk is (1, rows, columns, 1), the last strip may be shorter
+                na_chunk = na_chunk.reshape(na_chunk.shape[-3], na_chunk.shape[-2])
+                i_dy = (yy - i_y0) * i_chunk_h
+                i_dx = (xx - i_x0) * i_chunk_w
+                na_buf[i_dy:i_dy + na_chunk.shape[0], i_dx:i_dx + na_chunk.shape[1]] = na_chunk
+        i_y -= i_y0 * i_chunk_h
+        i_x -= i_x0 * i_chunk_w
+        return na_buf[i_y:i_y + i_h, i_x:i_x + i_w]
+
+    def _read_cropped(self, file_idx, frame_num):
+        """
+        Return (view of) the crop window of the page frame_num
+        and True if it is taken from the memory-mapped file.
+        """
+        t_part = self._get_part(file_idx)
+        if t_part[2] is not None:
+            na_frame = self._map_page(file_idx, frame_num)
+            if na_frame is not None: return self._crop_frame(na_frame), True
+        na_frame = self._read_page_window(file_idx, frame_num, self._t_window)
+        if na_frame is not None: return na_frame, False
+        return self._crop_frame(self._get_page(file_idx, frame_num).asarray()), False
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        if self._t_window is not None:
+            return self._bin_frame(self._read_cropped(file_idx, frame_num)[0])
+        # try to read the frame
+        t_part = self._get_part(file_idx)
+        if t_part[2] is not None:
+            na_frame = self._map_page(file_idx, frame_num)
+            if na_frame is not None: return na_frame
+        if self.b_page_index:
+            na_frame = self._read_page_window(file_idx, frame_num)
+            if na_frame is not None: return na_frame
+        return self._get_page(file_idx, frame_num).asarray()
+
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        if self._t_window is not None:
+            na_frame, b_mapped = self._read_cropped(file_idx, frame_num)
+            self._bin_frame(na_frame, na_out)
+            return b_mapped
+        t_part = self._get_part(file_idx)
+        if t_part[2] is not None:
+            na_frame = self._map_page(file_idx, frame_num)
+            if na_frame is not None:
+                np.copyto(na_out, na_frame) # straight from the memory-mapped file
+                return True
+        if self.b_page_index:
+            na_frame = self._read_page_window(file_idx, frame_num)
+            if na_frame is not None:
+                np.copyto(na_out, na_frame) # strips are decoded into a temporary buffer
+                return False
+        self._get_page(file_idx, frame_num).asarray(out=na_out)
+        return True
 
-        # freeze lists into tuples
-        self.t_vid_files = tuple(l_vid_files)
-        self.t_vid_streams = tuple(l_vid_streams)
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        oc_tiff_record, oc_pages, oc_mmap = self._get_part(file_idx)
+        if self._t_window is not None or self.b_page_index:
+            for tt in range(i_count):
+                self._decode_frame_into(file_idx, frame_num + tt, na_out[tt])
+        elif oc_mmap is not None:
+            for tt in range(i_count):
+                na_frame = self._map_page(file_idx, frame_num + tt)
+                if na_frame is not None:
+                    na_out[tt] = na_frame
+                else:
+                    oc_pages[frame_num + tt].asarray(out=na_out[tt])
+        else:
+            # multiple pages are decoded by the tifffile in parallel
+            oc_tiff_record.asarray(key=range(frame_num, frame_num + i_count), out=na_out)
+    #
+#
 
-        # [1000, 2000, 3000, 4000, 4963], read only!
-        self.na_ends = np.array(self.df_info['end'], dtype=np.int32)
 
-        self.shape = (int(self.df_info['height'][0]), int(self.df_info['width'][0]), int(self.df_info['duration'].cumsum().sum()))
-        self.t_frame_hw = (int(self.df_info['height'][0]), int(self.df_info['width'][0]))
-        self.i_nframes = int(self.df_info['duration'].cumsum().sum())
+class CMuPaMovieZF(CMuPaMovie):
+    """
+    Class represents a MultiPart Movie (zip archives of single-page tiff files).
+    The MultiPart Movie constructed from a tuple of zip file names.
+    The file names in the tuple must be in correct temporal order.
+    For details refer to documentation for the base class CMuPaMovie()
+    If i_inflate_threads > 0, members next to the requested one are
+    read, decompressed and decoded in advance by a pool of threads
+    during sequential reading (read_next_frame(), every i_step-th member,
+    see set_step()). Random access reads only the requested members,
+    members of a block requested by read_frames() are decoded concurrently.
+    """
+    def __init__(self, t_file_names, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1, i_inflate_threads=0, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        self.d_name_lists = {}
+        self.i_inflate_threads = int(i_inflate_threads)
+        self.i_inflate_ahead = 2 * self.i_inflate_threads # number of members decoded in advance
+        self._oc_inflate_pool = None
+        self._d_inflated = {} # abs_frame_num -> Future of the decoded member
 
-        if b_verbose:
-            print(self.df_info)
+        l_info = self._init_parts('zip')
+        for idx in range(len(self.t_file_names)):
+            self.d_name_lists[self.t_file_names[idx]] = list(l_info[idx]['member_names'])
+
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        hZipFile = zf.ZipFile(self.t_file_names[file_idx], mode='r')
+        return (hZipFile, hZipFile)
+
+    def _close_part(self, file_idx, t_part):
+        t_part[0].close()
+
+    def _probe_part(self, file_idx, t_part):
+        hZipFile = t_part[0]
+        l_names = hZipFile.namelist().copy()
+        oc_tmp_frame = tifffile.imread(io.BytesIO(hZipFile.read(l_names[0])))
+        return {
+            'frames': len(l_names),
+            'frame_rate': np.nan, # frame rate is not available in TIFFs
+            'width':  int(oc_tmp_frame.shape[1]), # this is correct
+            'height': int(oc_tmp_frame.shape[0]),
+            'format': str(oc_tmp_frame.dtype),
+            'member_names': np.array(l_names, dtype=str)
+        }
+
+    def _decode_member(self, file_idx, frame_num):
+        # the BytesIO shares (does not copy) the bytes returned by the ZipFile.read()
+        b_data = self._get_part(file_idx)[1].read(self.d_name_lists[self.t_file_names[file_idx]][frame_num])
+        return self._window_frame(tifffile.imread(io.BytesIO(b_data)))
+
+    def _get_inflate_pool(self):
+        # zlib and tifffile release the GIL, so members are decoded concurrently
+        if self._oc_inflate_pool is None:
+            self._oc_inflate_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.i_inflate_threads)
+        return self._oc_inflate_pool
+
+    def _drop_inflated(self, r_keep=()):
+        """
+        Forget members decoded in advance, except of those in r_keep.
+        """
+        for i_key in [i_key for i_key in self._d_inflated if i_key not in r_keep]:
+            self._d_inflated.pop(i_key).cancel()
 
-    def _read_frame(self, file_idx, frame_num):
-        b_ret = False
-        # try to read the frame
-        self.na_frame = self.t_vid_files[file_idx][frame_num].asarray()
-        self.i_curr_file_idx = file_idx
-        self.i_curr_rel_frame_num = frame_num
-        self.i_curr_abs_frame_num = self.rel2abs(self.i_curr_file_idx, self.i_curr_rel_frame_num)
-        b_ret = True
-        return b_ret
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        if self.i_inflate_threads == 0:
+            return self._decode_member(file_idx, frame_num)
 
-    def seek(self, abs_frame_num):
-        raise NotImplementedError("To be implemented")
+        i_abs = self.rel2abs(file_idx, frame_num)
+        if b_do_seek:
+            # random access, nothing is read in advance
+            oc_future = self._d_inflated.pop(i_abs, None)
+            self._drop_inflated()
+            if oc_future is not None and not oc_future.cancelled():
+                return oc_future.result()
+            return self._decode_member(file_idx, frame_num)
+
+        # sequential reading, members to be read next by the read_next_frame()
+        r_ahead = range(i_abs, min(i_abs + self.i_inflate_ahead * self.i_step, self.i_nframes), self.i_step)
+        self._drop_inflated(r_ahead)
+        for i_key in r_ahead:
+            if i_key not in self._d_inflated:
+                self._d_inflated[i_key] = self._get_inflate_pool().submit(self._decode_member, *self.abs2rel(i_key))
+        return self._d_inflated.pop(i_abs).result()
+
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        if self.i_inflate_threads == 0:
+            super()._decode_block(file_idx, frame_num, i_count, na_out)
+            return
+        # only members of the block are decoded, up to i_inflate_ahead at a time
+        self._drop_inflated()
+        oc_pool = self._get_inflate_pool()
+        dq_futures = collections.deque()
+        i_done = 0
+        for tt in range(i_count):
+            dq_futures.append(oc_pool.submit(self._decode_member, file_idx, frame_num + tt))
+            if len(dq_futures) >= self.i_inflate_ahead:
+                na_out[i_done] = dq_futures.popleft().result()
+                i_done += 1
+        while len(dq_futures) > 0:
+            na_out[i_done] = dq_futures.popleft().result()
+            i_done += 1
 
-    def read_frame(self, abs_frame_num):
+    def close(self):
         """
-        Read particular frame nubmer into self.na_frame
-        This method is slow because seek() is called every time.
+        Stop any background activity related to this object and close all files.
         """
-        rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
-        b_ret = self._read_frame(rel_file_idx, rel_frame_num)
-        if b_ret is True:
-            self.i_next_abs_frame_num = abs_frame_num + 1
-            if self.i_next_abs_frame_num > self.na_ends[-1]:
-                b_ret = False
-        return b_ret
+        self._stop_prefetch()
+        if self._oc_inflate_pool is not None:
+            self._oc_inflate_pool.shutdown(wait=True, cancel_futures=True)
+            self._oc_inflate_pool = None
+            self._d_inflated.clear()
+        self._close_parts()
+    #
+#
 
-    def read_next_frame(self):
-        """
-        Read next frame at the current position.
-        This method is fast.
-        You can set current position once by using seek(frame_number).
-        """
-        rel_file_idx, rel_frame_num = self.abs2rel(self.i_next_abs_frame_num)
-        b_ret = self._read_frame(rel_file_idx, rel_frame_num)
-        if b_ret is True:
-            self.i_next_abs_frame_num += 1
-            if self.i_next_abs_frame_num > self.na_ends[-1]:
-                b_ret = False
-        return b_ret
 
-    def get_frame_stat(self):
-        return "curr_abs_frame_num: %d\t curr_file_idx: %d\t curr_rel_frame_num: %d" % ( \
-            self.i_curr_abs_frame_num, \
-            self.i_curr_file_idx, \
-            self.i_curr_rel_frame_num \
-        )
+class CMuPaMovieNpy(CMuPaMovie):
+    """
+    Class represents a MultiPart Movie (NumPy .npy files backend).
+    The MultiPart Movie constructed from a tuple of .npy file names, each
+    file holds (T x H x W) or (T x H x W x C) array, see convert_to_npy().
+    The file names in the tuple must be in correct temporal order.
+    For details refer to documentation for the base class CMuPaMovie()
+    Files are memory-mapped, frames (self.na_frame) are read-only views
+    into the memory-mapped files, nothing is decoded or copied.
+    The self.t_vid_streams are the memory-mapped arrays themselves,
+    so any slicing of the movie is possible.
+    """
+    def __init__(self, t_file_names, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        l_info = self._init_parts('npy')
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        na_movie = np.load(self.t_file_names[file_idx], mmap_mode='r')
+        if na_movie.ndim not in (3, 4):
+            raise ValueError("Unexpected shape %s of: %s" % (repr(na_movie.shape), self.t_file_names[file_idx]))
+        return (na_movie, na_movie)
+
+    def _close_part(self, file_idx, t_part):
+        pass # the file is unmapped when the last view into it is released
+
+    def _probe_part(self, file_idx, t_part):
+        na_movie = t_part[0]
+        return {
+            'frames': int(na_movie.shape[0]),
+            'frame_rate': np.nan, # frame rate is not stored
+            'width':  int(na_movie.shape[2]),
+            'height': int(na_movie.shape[1]),
+            'format': str(na_movie.dtype)
+        }
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        return self._window_frame(self._get_part(file_idx)[1][frame_num])
+
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        na_frame = self._crop_frame(self._get_part(file_idx)[1][frame_num])
+        self._bin_frame(na_frame, na_out)
+        return True
+
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        if self.i_bin > 1:
+            super()._decode_block(file_idx, frame_num, i_count, na_out)
+            return
+        na_block = self._get_part(file_idx)[1][frame_num:frame_num + i_count]
+        if self._t_window is not None:
+            i_y, i_x, i_h, i_w = self._t_window
+            na_block = na_block[:, i_y:i_y + i_h, i_x:i_x + i_w]
+        na_out[...] = na_block
     #
 #
 
 
-class CMuPaMovieZF(CMuPaMovie):
-    def __init__(self, t_file_names, b_verbose=False):
-        super().__init__(t_file_names)
-        self.d_name_lists = {}
-        self.oc_bstream = io.BytesIO()
+class CMuPaMovieFFII(CMuPaMovie):
+    """
+    Class represents a MultiPart Movie (raw FFII recordings backend).
+    The MultiPart Movie constructed from a tuple of .ffii file names.
+    The file names in the tuple must be in correct temporal order.
+    For details refer to documentation for the base class CMuPaMovie()
+    Frame offsets are found by a single scan of frame headers (cached in
+    the sidecar index if b_use_index is True). Files are memory-mapped,
+    frames (self.na_frame) are read-only views into the memory-mapped
+    files, nothing is decoded or copied. Frame rate is not stored in
+    FFII files, so it can be given by f_fps.
+    """
+    def __init__(self, t_file_names, f_fps=np.nan, i_prefetch_depth=0, b_use_index=False, i_max_open_files=None, i_cache_bytes=0, \
+                 t_crop=None, i_bin=1, b_verbose=False):
+        super().__init__(t_file_names, i_prefetch_depth=i_prefetch_depth, b_use_index=b_use_index, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes, t_crop=t_crop, i_bin=i_bin)
+        l_info = self._init_parts('ffii', ('frame_offsets',))
+        for d_index in l_info:
+            d_index['frame_rate'] = float(f_fps)
+        self.t_frame_offsets = tuple(d_index['frame_offsets'] for d_index in l_info)
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        na_mmap = np.memmap(self.t_file_names[file_idx], dtype=np.uint8, mode='r')
+        return (na_mmap, na_mmap)
+
+    def _close_part(self, file_idx, t_part):
+        pass # the file is unmapped when the last view into it is released
+
+    def _probe_part(self, file_idx, t_part):
+        i_frame_h, i_frame_w, na_offsets = _scan_ffii_frames(t_part[0])
+        return {
+            'frames': int(na_offsets.shape[0]),
+            'frame_rate': np.nan,
+            'width':  int(i_frame_w),
+            'height': int(i_frame_h),
+            'format': 'uint8',
+            'frame_offsets': na_offsets
+        }
+
+    def _map_frame(self, file_idx, frame_num):
+        return np.ndarray(self.t_frame_hw_raw, dtype=np.uint8, buffer=self._get_part(file_idx)[1], \
+            offset=int(self.t_frame_offsets[file_idx][frame_num]))
+
+    def _init_info(self, l_info, b_verbose=False):
+        super()._init_info(l_info, b_verbose=b_verbose)
+        self.t_frame_hw_raw = (int(self.df_info['height'][0]), int(self.df_info['width'][0]))
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        return self._window_frame(self._map_frame(file_idx, frame_num))
+
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        self._bin_frame(self._crop_frame(self._map_frame(file_idx, frame_num)), na_out)
+        return True
 
-        # to be turned into tuples at the end of this constructor
-        l_vid_files = []
-        l_vid_streams = []
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        if self.i_bin > 1:
+            super()._decode_block(file_idx, frame_num, i_count, na_out)
+            return
+        # frames are of the same size, so the block is a strided view into the file
+        i_frame_h, i_frame_w = self.t_frame_hw_raw
+        na_block = np.ndarray((i_count, i_frame_h, i_frame_w), dtype=np.uint8, buffer=self._get_part(file_idx)[1], \
+            offset=int(self.t_frame_offsets[file_idx][frame_num]), strides=(8 + i_frame_h * i_frame_w, i_frame_w, 1))
+        if self._t_window is not None:
+            i_y, i_x, i_h, i_w = self._t_window
+            na_block = na_block[:, i_y:i_y + i_h, i_x:i_x + i_w]
+        na_out[...] = na_block
+    #
+#
 
-        for idx in range(len(self.t_file_names)):
-            self.df_info.loc[idx, 'file_name'] = self.t_file_names[idx]
-            hZipFile = zf.ZipFile(self.t_file_names[idx], mode='r')
-            self.d_name_lists[self.t_file_names[idx]] = hZipFile.namelist().copy()
 
-            self.oc_bstream.seek(0)
-            self.oc_bstream.write(hZipFile.read(self.d_name_lists[self.t_file_names[idx]][0]))
-            self.oc_bstream.seek(0)
-            oc_tmp_frame = tifffile.imread(self.oc_bstream)
+class CMuPaMovieConcat(CMuPaMovie):
+    """
+    Class represents a virtual movie made of several MultiPart Movies
+    (recording sessions) concatenated under a single absolute frame number.
+    The l_movies must be in correct temporal order and their frames must be
+    of the same shape and type. Sessions play the role of files of the base
+    class CMuPaMovie(): self.na_ends are the session boundaries, abs2rel()
+    returns (session index, frame number within the session) and the
+    self.i_curr_file_idx is the session of the current frame.
+    If i_max_open_files is not None, files of the least recently used sessions
+    are closed (see the CMuPaMovie.close()) so no more than i_max_open_files
+    sessions have open files at the same time.
+    """
+    def __init__(self, l_movies, i_prefetch_depth=0, i_max_open_files=None, i_cache_bytes=0, b_verbose=False):
+        if len(l_movies) == 0:
+            raise ValueError("Wrong input: at least one movie is required")
+        self.l_movies = list(l_movies) # read only!
+        # sessions are named after their first files
+        super().__init__(tuple(oc_movie.t_file_names[0] for oc_movie in self.l_movies), i_prefetch_depth=i_prefetch_depth, \
+            i_max_open_files=i_max_open_files, i_cache_bytes=i_cache_bytes)
+        # all information is already known, files opened by the movie constructors
+        # are closed, so sessions are re-opened on demand (see i_max_open_files)
+        l_info = []
+        for idx, oc_movie in enumerate(self.l_movies):
+            l_info.append(self._probe_part(idx, (oc_movie, oc_movie)))
+            oc_movie.close()
+        if any(d_info['format'] != l_info[0]['format'] for d_info in l_info):
+            raise ValueError("Frame format is not consistent across input movies")
+        self._init_info(l_info, b_verbose=b_verbose)
+
+    def _open_part(self, file_idx):
+        oc_movie = self.l_movies[file_idx]
+        oc_movie._get_part(0) # so the next session is opened in advance as well
+        return (oc_movie, oc_movie)
+
+    def _close_part(self, file_idx, t_part):
+        t_part[0].close()
+
+    def _probe_part(self, file_idx, t_part):
+        oc_movie = t_part[0]
+        return {
+            'frames': int(oc_movie.i_nframes),
+            'frame_rate': oc_movie.df_info['frame_rate'][0],
+            'width':  int(oc_movie.t_frame_hw[1]), # after crop and binning
+            'height': int(oc_movie.t_frame_hw[0]),
+            'format': oc_movie.df_info['format'][0]
+        }
+
+    def get_session_bounds(self, i_session):
+        """
+        Return (first, last + 1) absolute frame numbers of the session i_session.
+        """
+        return (self.rel2abs(i_session, 0), int(self.na_ends[i_session]))
+
+    def _decode_frame(self, file_idx, frame_num, b_do_seek=True):
+        oc_movie = self._get_part(file_idx)[0]
+        rel_file_idx, rel_frame_num = oc_movie.abs2rel(frame_num)
+        oc_movie._preopen_next(rel_file_idx, rel_frame_num)
+        return oc_movie._decode_frame(rel_file_idx, rel_frame_num, b_do_seek=b_do_seek)
+
+    def _decode_frame_into(self, file_idx, frame_num, na_out, b_do_seek=True):
+        oc_movie = self._get_part(file_idx)[0]
+        rel_file_idx, rel_frame_num = oc_movie.abs2rel(frame_num)
+        oc_movie._preopen_next(rel_file_idx, rel_frame_num)
+        return oc_movie._decode_frame_into(rel_file_idx, rel_frame_num, na_out, b_do_seek=b_do_seek)
+
+    def _decode_block(self, file_idx, frame_num, i_count, na_out):
+        self._get_part(file_idx)[0].read_frames(frame_num, i_count, na_out=na_out)
+    #
+#
 
-            self.df_info.loc[idx, 'duration'] = len(self.d_name_lists[self.t_file_names[idx]])
-            self.df_info.loc[idx, 'frames']   = len(self.d_name_lists[self.t_file_names[idx]])
-            # frame rate is not available in TIFFs: self.df_info.loc[idx, 'frame_rate'] =
-            self.df_info.loc[idx, 'width']  = int(oc_tmp_frame.shape[1]) # this is correct
-            self.df_info.loc[idx, 'height'] = int(oc_tmp_frame.shape[0])
-            self.df_info.loc[idx, 'format'] = oc_tmp_frame.dtype
 
-            l_vid_files.append( hZipFile )
-            l_vid_streams.append( hZipFile )
+def convert_to_npy(oc_movie, s_out_fname_base, i_nframes_per_file=None, i_block_size=64, b_delete_existing=False):
+    """
+    Convert any CMuPaMovie object into .npy file(s) readable by the CMuPaMovieNpy.
+    Frames are streamed by blocks of i_block_size frames, so the amount of
+    memory used does not depend on the movie length. If i_nframes_per_file
+    is None the output is s_out_fname_base + ".npy", otherwise the output is
+    split into files s_out_fname_base + "1.npy", "2.npy" etc.
+    Return tuple of output file names.
+    """
+    if i_nframes_per_file is not None and i_nframes_per_file < 1:
+        raise ValueError("Wrong input: i_nframes_per_file must be None or positive")
+    if i_block_size < 1:
+        raise ValueError("Wrong input: i_block_size must be positive")
+    t_frame_shape, frame_dtype = oc_movie._get_frame_spec()
+    i_nframes = int(oc_movie.na_ends[-1])
+
+    l_out_fnames = []
+    if i_nframes_per_file is None:
+        l_out_fnames.append((s_out_fname_base + ".npy", 0, i_nframes))
+    else:
+        for i_start in range(0, i_nframes, i_nframes_per_file):
+            l_out_fnames.append(("%s%d.npy" % (s_out_fname_base, len(l_out_fnames) + 1), i_start, min(i_start + i_nframes_per_file, i_nframes)))
+
+    for s_out_fname, _, _ in l_out_fnames:
+        if os.path.isfile(s_out_fname) and not b_delete_existing:
+            raise ValueError("Requested output file already exist. Die in order to prevent data loss.")
 
-        # check if all video files have the same frame width and height
-        if self.df_info['width'].sum() != \
-           self.df_info['width'][0] * len(self.df_info['width']):
-            raise ValueError("Frame width is not consistent across input video files")
-        if self.df_info['height'].sum() != \
-           self.df_info['height'][0] * len(self.df_info['height']):
-            raise ValueError("Frame height is not consistent across input video files")
+    for s_out_fname, i_start, i_end in l_out_fnames:
+        na_out = np.lib.format.open_memmap(s_out_fname, mode='w+', dtype=frame_dtype, shape=(i_end - i_start,) + tuple(t_frame_shape))
+        for i_abs in range(i_start, i_end, i_block_size):
+            i_count = min(i_block_size, i_end - i_abs)
+            oc_movie.read_frames(i_abs, i_count, na_out=na_out[i_abs - i_start:i_abs - i_start + i_count])
+            na_out.flush() # do not let dirty pages accumulate
+        del na_out
 
-        self.df_info['start'] = self.df_info['duration'].cumsum() - self.df_info['duration']
-        self.df_info['end']   = self.df_info['duration'].cumsum()
-        # self.df_info = self.df_info.set_index(['file_name'], append = True)
+    return tuple(s_out_fname for s_out_fname, _, _ in l_out_fnames)
+#
 
-        # freeze lists into tuples
-        self.t_vid_files = tuple(l_vid_files)
-        self.t_vid_streams = tuple(l_vid_streams)
 
-        # [1000, 2000, 3000, 4000, 4963], read only!
-        self.na_ends = np.array(self.df_info['end'], dtype=np.int32)
+def convert_to_tiff(oc_movie, s_fname_out, i_block_size=64, b_delete_existing=False, s_codec='zlib', i_level=None):
+    """
+    Convert any CMuPaMovie object into single multi-page BigTIFF file
+    written by the CSingleTiffWriter (one page per frame).
+    Frames are streamed by blocks of i_block_size frames, so the amount of
+    memory used does not depend on the movie length.
+    """
+    if i_block_size < 1:
+        raise ValueError("Wrong input: i_block_size must be positive")
+    t_frame_shape, frame_dtype = oc_movie._get_frame_spec()
+    i_nframes = int(oc_movie.na_ends[-1])
+    oc_writer = CSingleTiffWriter(s_fname_out, b_delete_existing=b_delete_existing, s_codec=s_codec, i_level=i_level)
+    na_block = np.empty((min(i_block_size, max(i_nframes, 1)),) + tuple(t_frame_shape), dtype=frame_dtype)
+    try:
+        for i_abs in range(0, i_nframes, i_block_size):
+            i_count = min(i_block_size, i_nframes - i_abs)
+            oc_movie.read_frames(i_abs, i_count, na_out=na_block[:i_count])
+            for na_frame in na_block[:i_count]:
+                oc_writer.write_next_frame(na_frame)
+    finally:
+        oc_writer.close()
+#
 
-        self.shape = (int(self.df_info['height'][0]), int(self.df_info['width'][0]), int(self.df_info['duration'].cumsum().sum()))
-        self.t_frame_hw = (int(self.df_info['height'][0]), int(self.df_info['width'][0]))
-        self.i_nframes = int(self.df_info['duration'].cumsum().sum())
 
-        if b_verbose:
-            print(self.df_info)
+def _quantize_frame(na_in, na_out=None, f_gain=None, f_offset=0.0):
+    """
+    Return the frame converted to np.uint16 (into the na_out if given).
+    Frames of other than np.uint16 type are normalized to the full np.uint16
+    range if f_gain is None, or scaled as na_in * f_gain + f_offset otherwise.
+    """
+    if na_in.dtype == np.uint16:
+        if na_out is None: return na_in
+        na_out[...] = na_in
+        return na_out
+    if f_gain is None:
+        return cv.normalize(na_in, na_out, alpha=0, beta=(2**16-1), norm_type=cv.NORM_MINMAX, dtype=cv.CV_16U)
+    # scaling, rounding and saturation in one pass
+    return cv.addWeighted(na_in, f_gain, na_in, 0.0, f_offset, dst=na_out, dtype=cv.CV_16U)
+#
 
-    def _read_frame(self, file_idx, frame_num):
-        b_ret = False
 
-        # try to read the frame
-        self.oc_bstream.seek(0)
-        self.oc_bstream.write(
-            self.t_vid_streams[file_idx].read(
-                self.d_name_lists[self.t_file_names[file_idx]][frame_num]
-            )
-        )
-        self.oc_bstream.seek(0)
-        self.na_frame = tifffile.imread(self.oc_bstream)
+TIFF_WRITER_CODECS = ('none', 'zlib', 'lzma', 'zstd', 'lzw', 'packbits')
+_t_tiff_writer_codecs = None
 
-        self.i_curr_file_idx = file_idx
-        self.i_curr_rel_frame_num = frame_num
-        self.i_curr_abs_frame_num = self.rel2abs(self.i_curr_file_idx, self.i_curr_rel_frame_num)
-        b_ret = True
-        return b_ret
+def get_tiff_codecs():
+    """
+    Return tuple of lossless codecs (of the TIFF_WRITER_CODECS) available for
+    the CSingleTiffWriter. Some of them require the imagecodecs package.
+    """
+    global _t_tiff_writer_codecs
+    if _t_tiff_writer_codecs is None:
+        l_codecs = []
+        for s_codec in TIFF_WRITER_CODECS:
+            try:
+                with tifffile.TiffWriter(io.BytesIO()) as oc_tiff:
+                    oc_tiff.write(np.zeros((8, 8), dtype=np.uint16), compression=None if s_codec == 'none' else s_codec)
+                l_codecs.append(s_codec)
+            except Exception:
+                pass # missing or too old package
+        _t_tiff_writer_codecs = tuple(l_codecs)
+    return _t_tiff_writer_codecs
+#
 
-    def seek(self, abs_frame_num):
-        raise NotImplementedError("To be implemented")
 
-    def read_frame(self, abs_frame_num):
+class CSingleTiffWriter(object):
+    """
+    Write frames into a single multi-page BigTIFF file. Frames of other than
+    np.uint16 type are normalized to the full np.uint16 range frame by frame.
+    Frames are compressed by the s_codec (see get_tiff_codecs()) with the
+    i_level (1-9 for zlib, 0-9 for lzma, default of the codec if None).
+    Strips of i_rowsperstrip rows are compressed by up to i_nworkers threads
+    (the tifffile defaults are used if None).
+    If i_queue_depth > 0, frames are compressed and written by a background
+    thread. The write_next_frame() copies the frame into a queue of up to
+    i_queue_depth frames and returns, unless the queue is full, in which case
+    it waits for the writing thread (backpressure), see get_queue_stat().
+    Writing errors are raised by the next write_next_frame() or by close().
+    If f_gain is given, frames of other than np.uint16 type are quantized
+    with the fixed scale: na_in * f_gain + f_offset, saturated to np.uint16.
+    If i_calib_nframes > 0, the scale maps the min/max range of the first
+    i_calib_nframes frames to the full np.uint16 range. The f_gain and
+    f_offset in use are stored in the metadata of the tiff file.
+    If i_batch_size > 1, 2-D frames are collected and written by i_batch_size
+    pages in a single call.
+    """
+    def __init__(self, s_fname_out, b_delete_existing=False, s_codec='zlib', i_level=None, i_nworkers=None, i_rowsperstrip=None, i_queue_depth=0, \
+                 f_gain=None, f_offset=0.0, i_calib_nframes=0, i_batch_size=1):
+        if os.path.isfile(s_fname_out) and not b_delete_existing:
+            raise ValueError("Requested output file already exist. Die in order to prevent data loss.")
+        if s_codec not in get_tiff_codecs():
+            raise ValueError("Wrong input: codec %s is not available, use one of: %s" % (repr(s_codec), ", ".join(get_tiff_codecs())))
+        if i_batch_size < 1 or i_calib_nframes < 0 or (f_gain is not None and i_calib_nframes > 0):
+            raise ValueError("Wrong input: %s" % repr((f_gain, i_calib_nframes, i_batch_size)))
+        self.s_fname_out = s_fname_out
+        self.d_write_kwargs = {'compression': None if s_codec == 'none' else s_codec}
+        if i_level is not None and s_codec != 'none':
+            self.d_write_kwargs['compressionargs'] = {'level': int(i_level)}
+        if i_nworkers is not None:
+            self.d_write_kwargs['maxworkers'] = int(i_nworkers)
+        if i_rowsperstrip is not None:
+            self.d_write_kwargs['rowsperstrip'] = int(i_rowsperstrip)
+        self.oc_tiff = tifffile.TiffWriter(self.s_fname_out, bigtiff=True)
+        # fixed scale quantization, disabled if f_gain is None
+        self.f_gain = None   # read only!
+        self.f_offset = None # read only!
+        self.i_calib_nframes = int(i_calib_nframes)
+        self._l_calib_frames = [] if self.i_calib_nframes > 0 else None
+        if f_gain is not None: self._set_scale(f_gain, f_offset)
+        # multi-page batches
+        self.i_batch_size = int(i_batch_size)
+        self._na_batch = None
+        self._i_batch_used = 0
+        # background writing, disabled if i_queue_depth == 0
+        self.i_queue_depth = int(i_queue_depth)
+        self.i_frames_written = 0  # read only!
+        self.i_queue_max_used = 0  # read only!
+        self.i_blocked_writes = 0  # read only! number of write_next_frame() calls waited for the full queue
+        self.f_blocked_time = 0.0  # read only! total time (seconds) of waiting for the full queue
+        self._oc_queue  = None
+        self._oc_thread = None
+        self._oc_error  = None
+        if self.i_queue_depth > 0:
+            self._oc_queue = queue.Queue(maxsize=self.i_queue_depth)
+            self._oc_thread = threading.Thread(target=self._writer_worker, daemon=True)
+            self._oc_thread.start()
+    def _set_scale(self, f_gain, f_offset):
+        self.f_gain = float(f_gain)
+        self.f_offset = float(f_offset)
+        self.d_write_kwargs['metadata'] = {'gain': self.f_gain, 'offset': self.f_offset}
+    def _calibrate(self):
         """
-        Read particular frame nubmer into self.na_frame
-        This method is slow because seek() is called every time.
+        Set the fixed scale from the frames collected so far and write them.
+        Called by the caller thread only, so the writing thread never sees
+        the scale half-set.
         """
-        rel_file_idx, rel_frame_num = self.abs2rel(abs_frame_num)
-        b_ret = self._read_frame(rel_file_idx, rel_frame_num)
-        if b_ret is True:
-            self.i_next_abs_frame_num = abs_frame_num + 1
-            if self.i_next_abs_frame_num > self.na_ends[-1]:
-                b_ret = False
-        return b_ret
-
-    def read_next_frame(self):
+        l_frames, self._l_calib_frames = self._l_calib_frames, None
+        l_frames_float = [na_frame for na_frame in l_frames if na_frame.dtype != np.uint16]
+        if len(l_frames_float) > 0:
+            f_min = min(float(np.nanmin(na_frame)) for na_frame in l_frames_float)
+            f_max = max(float(np.nanmax(na_frame)) for na_frame in l_frames_float)
+            f_gain = (2**16-1) / (f_max - f_min) if f_max > f_min else 1.0
+            self._set_scale(f_gain, -f_min * f_gain)
+        for na_frame in l_frames:
+            self._put_frame(na_frame)
+    def _quantize(self, na_in, na_out=None):
+        return _quantize_frame(na_in, na_out, self.f_gain, self.f_offset)
+    def _flush_batch(self):
+        if self._i_batch_used == 0: return
+        # otherwise batches of 3 or 4 pages would be taken for RGB(A) images
+        self.oc_tiff.write(self._na_batch[:self._i_batch_used], photometric='minisblack', **self.d_write_kwargs)
+        self.i_frames_written += self._i_batch_used
+        self._i_batch_used = 0
+    def _write_frame(self, na_in):
+        if self.i_batch_size == 1 or na_in.ndim != 2:
+            self._flush_batch()
+            self.oc_tiff.write(self._quantize(na_in), **self.d_write_kwargs)
+            self.i_frames_written += 1
+            return
+        if self._na_batch is None or self._na_batch.shape[1:] != na_in.shape:
+            self._flush_batch()
+            self._na_batch = np.empty((self.i_batch_size,) + na_in.shape, dtype=np.uint16)
+        self._quantize(na_in, self._na_batch[self._i_batch_used])
+        self._i_batch_used += 1
+        if self._i_batch_used == self.i_batch_size: self._flush_batch()
+    def _writer_worker(self):
         """
-        Read next frame at the current position.
-        This method is fast.
-        You can set current position once by using seek(frame_number).
+        Body of the writing thread. After an error the rest of frames is dropped.
         """
-        rel_file_idx, rel_frame_num = self.abs2rel(self.i_next_abs_frame_num)
-        b_ret = self._read_frame(rel_file_idx, rel_frame_num)
-        if b_ret is True:
-            self.i_next_abs_frame_num += 1
-            if self.i_next_abs_frame_num > self.na_ends[-1]:
-                b_ret = False
-        return b_ret
-
-    def get_frame_stat(self):
-        return "curr_abs_frame_num: %d\t curr_file_idx: %d\t curr_rel_frame_num: %d" % ( \
-            self.i_curr_abs_frame_num, \
-            self.i_curr_file_idx, \
-            self.i_curr_rel_frame_num \
+        while True:
+            na_in = self._oc_queue.get()
+            if na_in is None: return
+            if self._oc_error is not None: continue
+            try:
+                self._write_frame(na_in)
+            except Exception as e:
+                self._oc_error = e
+    def _check_error(self):
+        if self._oc_error is not None:
+            raise IOError("Unable to write into %s: %s" % (self.s_fname_out, self._oc_error))
+    def write_next_frame(self, na_in):
+        if self._l_calib_frames is not None:
+            self._check_error()
+            self._l_calib_frames.append(np.array(na_in))
+            if len(self._l_calib_frames) >= self.i_calib_nframes: self._calibrate()
+            return True
+        return self._put_frame(na_in)
+    def _put_frame(self, na_in):
+        if self._oc_queue is None:
+            self._write_frame(na_in)
+            return True
+        self._check_error()
+        if self.f_gain is not None and na_in.dtype != np.uint16:
+            na_in = self._quantize(na_in) # new (and smaller) frame
+        else:
+            na_in = np.array(na_in) # the caller may reuse the frame buffer
+        self.i_queue_max_used = max(self.i_queue_max_used, min(self._oc_queue.qsize() + 1, self.i_queue_depth))
+        try:
+            self._oc_queue.put_nowait(na_in)
+        except queue.Full:
+            f_t0 = time.perf_counter()
+            self._oc_queue.put(na_in)
+            self.i_blocked_writes += 1
+            self.f_blocked_time += time.perf_counter() - f_t0
+        return True
+    def close(self):
+        try:
+            if self._l_calib_frames is not None and self._oc_error is None:
+                self._calibrate() # less than i_calib_nframes frames
+        finally:
+            if self._oc_thread is not None:
+                self._oc_queue.put(None)
+                self._oc_thread.join()
+                self._oc_thread = None
+                self._oc_queue  = None
+            if self._oc_error is None:
+                self._flush_batch()
+            self.oc_tiff.close()
+        self._check_error()
+    def write_last_frame(self, na_in):
+        self.write_next_frame(na_in)
+        self.close()
+    def get_queue_stat(self):
+        return "frames_written: %d\t queue_used: %d\t queue_max_used: %d\t blocked_writes: %d\t blocked_time: %.3f" % ( \
+            self.i_frames_written, \
+            0 if self._oc_queue is None else self._oc_queue.qsize(), \
+            self.i_queue_max_used, \
+            self.i_blocked_writes, \
+            self.f_blocked_time \
         )
     #
 #
 
 
-class CSingleTiffWriter(object):
-    def __init__(self, s_fname_out, b_delete_existing=False):
+def _shrink_npy(s_fname, i_nframes):
+    """
+    Set the first dimension of the array stored in the .npy file to i_nframes
+    and truncate the file. The header is rewritten in place (padded to its
+    old length), so the offset of the data does not change.
+    """
+    with open(s_fname, 'r+b') as h_file:
+        t_version = np.lib.format.read_magic(h_file)
+        if t_version == (1, 0):
+            t_shape, b_fortran, dtype = np.lib.format.read_array_header_1_0(h_file)
+        else:
+            t_shape, b_fortran, dtype = np.lib.format.read_array_header_2_0(h_file)
+        i_data_offset = h_file.tell()
+        i_header_offset = 10 if t_version == (1, 0) else 12
+        t_shape = (int(i_nframes),) + tuple(t_shape[1:])
+        s_header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': b_fortran, 'shape': t_shape})
+        i_header_len = i_data_offset - i_header_offset
+        if len(s_header) + 1 > i_header_len:
+            raise ValueError("Unable to rewrite header of: %s" % s_fname)
+        h_file.seek(i_header_offset)
+        h_file.write((s_header.ljust(i_header_len - 1) + '\n').encode('latin1'))
+        h_file.truncate(i_data_offset + int(np.prod(t_shape)) * dtype.itemsize)
+#
+
+
+class CSingleNpyWriter(object):
+    """
+    Write frames into a single uncompressed .npy file readable by the
+    CMuPaMovieNpy. Intended for intermediate data kept on a scratch disk
+    or in RAM (e.g. /dev/shm), see convert_to_tiff() for archiving.
+    The file is memory-mapped and sized for i_nframes_max frames by the first
+    write_next_frame() call, close() shrinks it to the number of frames written.
+    Frames of other than np.uint16 type are normalized to the full np.uint16
+    range frame by frame, same as by the CSingleTiffWriter.
+    """
+    def __init__(self, s_fname_out, i_nframes_max, b_delete_existing=False):
         if os.path.isfile(s_fname_out) and not b_delete_existing:
             raise ValueError("Requested output file already exist. Die in order to prevent data loss.")
+        if i_nframes_max < 1:
+            raise ValueError("Wrong input: i_nframes_max must be positive")
         self.s_fname_out = s_fname_out
-        self.oc_tiff = tifffile.TiffWriter(self.s_fname_out, bigtiff=True)
+        self.i_nframes_max = int(i_nframes_max)
+        self.i_frames_written = 0 # read only!
+        self._na_out = None
     def write_next_frame(self, na_in):
-        if na_in.dtype == np.uint16:
-            self.oc_tiff.write(na_in, compression='zlib')
-        else:
-            self.oc_tiff.write(cv.normalize(na_in, None, alpha=0, beta=(2**16-1), norm_type=cv.NORM_MINMAX, dtype=cv.CV_16U), compression='zlib')
+        if self._na_out is None:
+            self._na_out = np.lib.format.open_memmap(self.s_fname_out, mode='w+', dtype=np.uint16, shape=(self.i_nframes_max,) + na_in.shape)
+        if self.i_frames_written >= self.i_nframes_max:
+            raise IOError("Unable to write into %s: more than %d frames" % (self.s_fname_out, self.i_nframes_max))
+        _quantize_frame(na_in, self._na_out[self.i_frames_written])
+        self.i_frames_written += 1
         return True
     def close(self):
-        self.oc_tiff.close()
+        if self._na_out is None: return
+        self._na_out.flush()
+        self._na_out = None
+        if self.i_frames_written < self.i_nframes_max:
+            _shrink_npy(self.s_fname_out, self.i_frames_written)
     def write_last_frame(self, na_in):
         self.write_next_frame(na_in)
         self.close()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+
+import queue
+import multiprocessing as mp
+import numpy as np
+
+
+"""
+Copyright (C) 2026 Denis Polygalov,
+Laboratory for Circuit and Behavioral Physiology,
+RIKEN Center for Brain Science, Saitama, Japan.
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, a copy is available at
+http://www.fsf.org/
+"""
+
+
+def _decode_worker(cls_movie, t_file_names, d_movie_kwargs, oc_ring, t_ring_shape, s_dtype, oc_task_queue, oc_done_queue):
+    """
+    Body of the worker process. Decode chunks of frames requested via the
+    oc_task_queue into slots of the shared memory oc_ring and report
+    finished (or failed) chunks via the oc_done_queue.
+    """
+    na_ring = np.frombuffer(oc_ring, dtype=s_dtype).reshape(t_ring_shape)
+    oc_movie = None
+    while True:
+        t_task = oc_task_queue.get()
+        if t_task is None: break
+        i_chunk_id, i_slot, i_start, i_count = t_task
+        try:
+            if oc_movie is None:
+                oc_movie = cls_movie(t_file_names, **d_movie_kwargs)
+            oc_movie.read_frames(i_start, i_count, na_out=na_ring[i_slot, :i_count])
+            oc_done_queue.put((i_chunk_id, i_slot, None))
+        except Exception as e:
+            oc_done_queue.put((i_chunk_id, i_slot, "%s: %s" % (type(e).__name__, e)))
+    if oc_movie is not None:
+        oc_movie.close()
+#
+
+class CMuPaMovieParallel(object):
+    """
+    Class represents a MultiPart Movie decoded by a pool of worker processes.
+    Each of i_nworkers processes opens its own cls_movie(t_file_names, **d_movie_kwargs)
+    object (CMuPaMovieCV, CMuPaMovieTiff or CMuPaMovieZF) and decodes chunks
+    of up to i_chunk_size consecutive frames (chunks do not cross file
+    boundaries) into a ring of i_lookahead slots in shared memory.
+    Workers take spans of i_span_chunks consecutive chunks in turn, so each
+    worker reads its span sequentially and seeks once per span instead of
+    decoding (grabbing) through frames of chunks taken by other workers.
+    Frames are copied out of the ring by read_next_frame() in exact order,
+    so it can be used in place of the CMuPaMovie.read_next_frame().
+    The ring takes i_lookahead * i_chunk_size frames of memory, all workers
+    are busy only if i_lookahead >= i_nworkers * i_span_chunks.
+    Call close() to stop the worker processes.
+    """
+    def __init__(self, cls_movie, t_file_names, i_nworkers=2, i_lookahead=None, i_chunk_size=16, i_span_chunks=4, d_movie_kwargs=None, b_verbose=False):
+        if i_nworkers < 1:
+            raise ValueError("Wrong input: i_nworkers must be at least 1")
+        if i_lookahead is None:
+            i_lookahead = 2 * i_nworkers * i_span_chunks
+        if i_lookahead < 1 or i_chunk_size < 1 or i_span_chunks < 1:
+            raise ValueError("Wrong input: %s" % repr((i_lookahead, i_chunk_size, i_span_chunks)))
+        self.cls_movie = cls_movie
+        self.t_file_names = t_file_names
+        self.d_movie_kwargs = {} if d_movie_kwargs is None else dict(d_movie_kwargs)
+        self.i_nworkers = int(i_nworkers)
+        self.i_lookahead = int(i_lookahead)
+        self.i_chunk_size = int(i_chunk_size)
+        self.i_span_chunks = int(i_span_chunks)
+
+        # local movie object provides information about the movie
+        self.oc_movie = cls_movie(t_file_names, **self.d_movie_kwargs, b_verbose=b_verbose)
+        self.df_info = self.oc_movie.df_info
+        self.na_ends = self.oc_movie.na_ends # read only!
+        self.shape = self.oc_movie.shape
+        self.t_frame_hw = self.oc_movie.t_frame_hw
+        self.i_nframes = self.oc_movie.i_nframes
+        self.na_frame = None # the frame (as Numpy array)
+        self.i_curr_file_idx  = 0     # read only!
+        self.i_curr_rel_frame_num = 0 # read only!
+        self.i_curr_abs_frame_num = 0 # read only!
+        self.i_next_abs_frame_num = 0 # read only!
+
+        t_frame_shape, frame_dtype = self.oc_movie._get_frame_spec()
+        self.oc_movie.close() # files are re-opened only if it is needed again
+        self._t_ring_shape = (self.i_lookahead, self.i_chunk_size) + tuple(t_frame_shape)
+        self._s_dtype = np.dtype(frame_dtype).str
+        self._oc_ring = None
+        self._na_ring = None
+        self._l_workers = None
+        self._l_task_queues = None # one per worker
+        self._oc_done_queue = None
+        self._reset_schedule(0)
+    #
+    def _reset_schedule(self, i_abs_start):
+        self._i_sched_abs = i_abs_start # the first frame of the next chunk to be scheduled
+        self._i_sched_chunk_id = 0      # id of the next chunk to be scheduled
+        self._i_read_chunk_id = 0       # id of the chunk frames are read from
+        self._i_sched_nchunks = 0       # number of chunks scheduled since the reset, defines spans
+        self._d_chunks = {}             # chunk_id -> [slot, start, count, b_done]
+        self._s_stale_chunk_ids = set() # chunks in progress which are not needed anymore
+        self._l_free_slots = list(range(self.i_lookahead))
+    #
+    def _start_workers(self):
+        self._oc_ring = mp.RawArray('B', int(np.prod(self._t_ring_shape)) * np.dtype(self._s_dtype).itemsize)
+        self._na_ring = np.frombuffer(self._oc_ring, dtype=self._s_dtype).reshape(self._t_ring_shape)
+        self._l_task_queues = [mp.Queue() for _ in range(self.i_nworkers)]
+        self._oc_done_queue = mp.Queue()
+        self._l_workers = []
+        for i_worker in range(self.i_nworkers):
+            oc_worker = mp.Process( \
+                target=_decode_worker, \
+                args=(self.cls_movie, self.t_file_names, self.d_movie_kwargs, self._oc_ring, \
+                      self._t_ring_shape, self._s_dtype, self._l_task_queues[i_worker], self._oc_done_queue), \
+                daemon=True \
+            )
+            oc_worker.start()
+            self._l_workers.append(oc_worker)
+    #
+    def _schedule(self):
+        """
+        Give a chunk of frames to decode to the worker processes for every free slot.
+        """
+        while len(self._l_free_slots) > 0 and self._i_sched_abs < self.na_ends[-1]:
+            rel_file_idx, _ = self.oc_movie.abs2rel(self._i_sched_abs)
+            i_count = min(self.i_chunk_size, int(self.na_ends[rel_file_idx]) - self._i_sched_abs)
+            i_slot = self._l_free_slots.pop()
+            self._d_chunks[self._i_sched_chunk_id] = [i_slot, self._i_sched_abs, i_count, False]
+            i_worker = (self._i_sched_nchunks // self.i_span_chunks) % self.i_nworkers
+            self._l_task_queues[i_worker].put((self._i_sched_chunk_id, i_slot, self._i_sched_abs, i_count))
+            self._i_sched_chunk_id += 1
+            self._i_sched_nchunks += 1
+            self._i_sched_abs += i_count
+    #
+    def _wait_done(self):
+        """
+        Wait for any chunk to be finished by the worker processes.
+        """
+        while True:
+            try:
+                i_chunk_id, i_slot, s_error = self._oc_done_queue.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not all(oc_worker.is_alive() for oc_worker in self._l_workers):
+                    raise RuntimeError("Worker process died unexpectedly")
+        if i_chunk_id in self._s_stale_chunk_ids:
+            self._s_stale_chunk_ids.remove(i_chunk_id)
+            self._l_free_slots.append(i_slot)
+            return
+        if s_error is not None:
+            raise IOError("Unable to decode frames in the worker process: %s" % s_error)
+        self._d_chunks[i_chunk_id][3] = True
+    #
+    def seek(self, abs_frame_num):
+        """
+        Set current position, so the next call of read_next_frame()
+        will read the frame number abs_frame_num.
+        Return False if requested frame number is out of range.
+        """
+        if abs_frame_num < 0 or abs_frame_num >= self.na_ends[-1]:
+            return False
+        if self._l_workers is not None:
+            # finished chunks are dropped now, the rest when they are finished
+            l_free_slots = self._l_free_slots
+            s_stale_chunk_ids = self._s_stale_chunk_ids
+            for i_chunk_id, (i_slot, _, _, b_done) in self._d_chunks.items():
+                if b_done:
+                    l_free_slots.append(i_slot)
+                else:
+                    s_stale_chunk_ids.add(i_chunk_id)
+            i_chunk_id = self._i_sched_chunk_id
+            self._reset_schedule(int(abs_frame_num))
+            self._i_sched_chunk_id = i_chunk_id
+            self._i_read_chunk_id = i_chunk_id
+            self._l_free_slots = l_free_slots
+            self._s_stale_chunk_ids = s_stale_chunk_ids
+        else:
+            self._reset_schedule(int(abs_frame_num))
+        self.i_next_abs_frame_num = int(abs_frame_num)
+        return True
+    #
+    def _next_frame_view(self):
+        """
+        Return view of the next frame in the ring and release the slot
+        (which is not overwritten until the next _schedule() call)
+        if this is the last frame of the chunk.
+        """
+        if self._l_workers is None:
+            self._start_workers()
+        self._schedule()
+        while not self._d_chunks[self._i_read_chunk_id][3]:
+            self._wait_done()
+        i_slot, i_start, i_count, _ = self._d_chunks[self._i_read_chunk_id]
+        tt = self.i_next_abs_frame_num - i_start
+        if tt + 1 == i_count:
+            del self._d_chunks[self._i_read_chunk_id]
+            self._l_free_slots.append(i_slot)
+            self._i_read_chunk_id += 1
+        return self._na_ring[i_slot, tt]
+    #
+    def _update_curr_frame(self, na_frame):
+        self.na_frame = na_frame
+        self.i_curr_abs_frame_num = self.i_next_abs_frame_num
+        self.i_curr_file_idx, self.i_curr_rel_frame_num = self.oc_movie.abs2rel(self.i_curr_abs_frame_num)
+        self.i_next_abs_frame_num += 1
+    #
+    def read_next_frame(self):
+        """
+        Read next frame at the current position into the self.na_frame
+        You can set current position by using seek(frame_number).
+        """
+        if self.i_next_abs_frame_num >= self.na_ends[-1]:
+            return False
+        self._update_curr_frame(self._next_frame_view().copy())
+        return True
+    #
+    def read_next_frame_into(self, na_out):
+        """
+        Same as read_next_frame() but the frame is copied into
+        the pre-allocated na_out array, which becomes the self.na_frame.
+        """
+        if self.i_next_abs_frame_num >= self.na_ends[-1]:
+            return False
+        np.copyto(na_out, self._next_frame_view())
+        self._update_curr_frame(na_out)
+        return True
+    #
+    def close(self):
+        """
+        Stop the worker processes and release the shared memory.
+        """
+        if self._l_workers is not None:
+            # drop chunks not taken by the workers yet
+            for oc_task_queue in self._l_task_queues:
+                while True:
+                    try:
+                        oc_task_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                oc_task_queue.put(None)
+            for oc_worker in self._l_workers:
+                oc_worker.join(timeout=5.0)
+                if oc_worker.is_alive(): oc_worker.terminate()
+            for oc_task_queue in self._l_task_queues:
+                oc_task_queue.close()
+            self._oc_done_queue.close()
+            self._l_workers = None
+            self._l_task_queues = None
+            self._oc_done_queue = None
+            self._na_ring = None
+            self._oc_ring = None
+        self._reset_schedule(self.i_next_abs_frame_num)
+        self.oc_movie.close()
+    #
+    def get_frame_stat(self):
+        return "curr_abs_frame_num: %d\t curr_file_idx: %d\t curr_rel_frame_num: %d" % ( \
+            self.i_curr_abs_frame_num, \
+            self.i_curr_file_idx, \
+            self.i_curr_rel_frame_num \
+        )
+    #
+#
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+
+import numpy as np
+
+
+"""
+Copyright (C) 2026 Denis Polygalov,
+Laboratory for Circuit and Behavioral Physiology,
+RIKEN Center for Brain Science, Saitama, Japan.
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, a copy is available at
+http://www.fsf.org/
+"""
+
+
+class CMuPaMovieTimed(object):
+    """
+    Time-aware view of a MultiPart Movie (CMuPaMovie or any of its backends).
+    Frame times are the sysClock values (milliseconds) of the camera i_cam_num
+    taken from the CDatContainer (the timestamp.dat file of the recording).
+    Frame numbers in the timestamp.dat start from 1 and the frame number N
+    is the abs_frame_num N-1 of the movie. The sysClock of the first frame
+    of each camera is an absolute value and the rest are relative to the
+    earliest of them, which is taken as time 0 (so the offset between
+    cameras is preserved). All queries are binary searches
+    over the self.na_times array, so they are O(log N) each.
+    """
+    def __init__(self, oc_movie, oc_dat_container, i_cam_num=0):
+        d_DAT = oc_dat_container.d_DAT
+        na_cam_mask = d_DAT['camNum'] == i_cam_num
+        if not na_cam_mask.any():
+            raise ValueError("Wrong input: no timestamps of the camera %d" % i_cam_num)
+        na_frame_nums = d_DAT['frameNum'][na_cam_mask] - 1
+        na_sys_clock  = d_DAT['sysClock'][na_cam_mask].copy()
+        # absolute sysClock of the first frames, relative to the earliest of all cameras
+        na_first_mask = d_DAT['frameNum'] == 1
+        if na_first_mask.any():
+            na_sys_clock[na_frame_nums == 0] -= d_DAT['sysClock'][na_first_mask].min()
+
+        # timestamps of frames not written into the movie are ignored
+        na_valid = (na_frame_nums >= 0) & (na_frame_nums < oc_movie.i_nframes)
+        na_frame_nums = na_frame_nums[na_valid]
+        if na_frame_nums.shape[0] != oc_movie.i_nframes or \
+           np.bincount(na_frame_nums, minlength=oc_movie.i_nframes).min() != 1:
+            raise ValueError("Timestamps of the camera %d do not match %d frames of the movie" % (i_cam_num, oc_movie.i_nframes))
+
+        self.oc_movie = oc_movie
+        self.i_cam_num = i_cam_num
+        # time (ms) of each frame of the movie, read only!
+        self.na_times = np.empty(oc_movie.i_nframes, dtype=np.int64)
+        self.na_times[na_frame_nums] = na_sys_clock[na_valid]
+        if (np.diff(self.na_times) < 0).any():
+            raise ValueError("Timestamps of the camera %d are not in temporal order" % i_cam_num)
+    #
+    def frame_at(self, f_time):
+        """
+        Return abs_frame_num of the frame acquired at or last before f_time
+        (it is the frame on the screen at that time), -1 if f_time is before the first frame.
+        """
+        return int(np.searchsorted(self.na_times, f_time, side='right')) - 1
+    #
+    def frames_between(self, f_time0, f_time1):
+        """
+        Return range of abs_frame_num of frames acquired within [f_time0, f_time1)
+        """
+        i_start, i_stop = np.searchsorted(self.na_times, (f_time0, f_time1), side='left')
+        return range(int(i_start), int(max(i_start, i_stop)))
+    #
+    def nearest_frames(self, na_event_times, f_max_lag=None):
+        """
+        Return array of abs_frame_num of frames nearest in time to each of na_event_times.
+        If f_max_lag is given, events farther than f_max_lag from any frame get -1.
+        """
+        na_event_times = np.asarray(na_event_times)
+        na_right = np.searchsorted(self.na_times, na_event_times, side='left')
+        na_right = np.clip(na_right, 1, self.na_times.shape[0] - 1) if self.na_times.shape[0] > 1 else np.zeros_like(na_right)
+        na_left = np.maximum(na_right - 1, 0)
+        na_nearest = np.where( \
+            np.abs(na_event_times - self.na_times[na_left]) <= np.abs(self.na_times[na_right] - na_event_times), \
+            na_left, na_right \
+        ).astype(np.int64)
+        if f_max_lag is not None:
+            na_nearest[np.abs(self.na_times[na_nearest] - na_event_times) > f_max_lag] = -1
+        return na_nearest
+    #
+    def read_frame_at(self, f_time):
+        """
+        Read the frame_at(f_time) into self.oc_movie.na_frame
+        Return False if f_time is before the first frame.
+        """
+        abs_frame_num = self.frame_at(f_time)
+        if abs_frame_num < 0:
+            return False
+        return self.oc_movie.read_frame(abs_frame_num)
+    #
+#
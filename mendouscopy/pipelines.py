@@ -3,6 +3,7 @@
 
 import os
 import sys
+import threading
 import cv2 as cv
 import numpy as np
 from scipy.stats import median_abs_deviation
@@ -10,7 +11,12 @@ from scipy.stats import median_abs_deviation
 from .mupamovie import CMuPaMovieCV
 from .mupamovie import CMuPaMovieZF
 from .mupamovie import CMuPaMovieTiff
+from .mupamovie import CMuPaMovieNpy
+from .mupamovie import CMuPaMovieFFII
+from .mupamovie import CMuPaMovieConcat
 from .mupamovie import CSingleTiffWriter
+from .mupamovie import CSingleNpyWriter
+from .mupamovie import convert_to_tiff
 from .filtering import CPrinCompWiper
 from .registration import CFrameRegECC
 from .registration import CFrameRegNone
@@ -59,13 +65,70 @@ def _check_file(s_fname, b_check_absence=False):
 #
 
 
-def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwrite_output=False, i_max_nframes=None):
+def _scratch_fnames(s_scratch_dir, s_out_fname_prefix):
+    """
+    Return names of the uncompressed intermediate files (registered movie, ROI mask)
+    """
+    return ( \
+        os.path.join(s_scratch_dir, s_out_fname_prefix + "register.npy"), \
+        os.path.join(s_scratch_dir, s_out_fname_prefix + "roi_mask.npy") \
+    )
+#
+
+
+def _open_intermediate(s_fname):
+    if s_fname.endswith(".npy"):
+        return CMuPaMovieNpy((s_fname,)) # notice the comma(!)
+    return CMuPaMovieTiff((s_fname,)) # notice the comma(!)
+#
+
+
+def archive_intermediates(s_target_dir, s_scratch_dir, s_out_fname_prefix, b_overwrite_output=False, b_background=True):
+    """
+    Compress intermediate files kept in the s_scratch_dir by the
+    register_frames_detect_rois() into register.tiff and roi_mask.tiff
+    files in the s_target_dir. If b_background is True, files are written by
+    a background thread which is returned (call join() to wait for it),
+    scratch files must not be removed until it is finished.
+    """
+    l_jobs = []
+    t_tiff_fnames = ( \
+        os.path.join(s_target_dir, s_out_fname_prefix + "register.tiff"), \
+        os.path.join(s_target_dir, s_out_fname_prefix + "roi_mask.tiff") \
+    )
+    for s_scr_fname, s_tiff_fname in zip(_scratch_fnames(s_scratch_dir, s_out_fname_prefix), t_tiff_fnames):
+        if not os.path.isfile(s_scr_fname): continue
+        if not b_overwrite_output: _check_file(s_tiff_fname, b_check_absence=True)
+        l_jobs.append((s_scr_fname, s_tiff_fname))
+
+    def _archive():
+        for s_scr_fname, s_tiff_fname in l_jobs:
+            oc_movie = CMuPaMovieNpy((s_scr_fname,)) # notice the comma(!)
+            convert_to_tiff(oc_movie, s_tiff_fname, b_delete_existing=b_overwrite_output)
+            oc_movie.close()
+    #
+    if not b_background:
+        _archive()
+        return None
+    oc_thread = threading.Thread(target=_archive)
+    oc_thread.start()
+    return oc_thread
+#
+
+
+def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwrite_output=False, i_max_nframes=None, \
+                             s_scratch_dir=None):
     s_roi_data_in_fname   = os.path.join(s_target_dir, s_out_fname_prefix + "roi_data.npy")
     s_roi_fluo_in_fname   = os.path.join(s_target_dir, s_out_fname_prefix + "roi_fluo.tiff")
     s_roi_mask_in_fname   = os.path.join(s_target_dir, s_out_fname_prefix + "roi_mask.tiff")
     s_register_in_fname   = os.path.join(s_target_dir, s_out_fname_prefix + "register.tiff")
     s_fluo_data_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "fluo.npy")
 
+    # use intermediate files written by the register_frames_detect_rois() into the s_scratch_dir
+    if s_scratch_dir is not None:
+        s_register_in_fname, s_roi_mask_scr_fname = _scratch_fnames(s_scratch_dir, s_out_fname_prefix)
+        if os.path.isfile(s_roi_mask_scr_fname): s_roi_mask_in_fname = s_roi_mask_scr_fname
+
     _check_file(s_roi_data_in_fname)
     _check_file(s_roi_fluo_in_fname)
     _check_file(s_roi_mask_in_fname)
@@ -76,7 +139,7 @@ def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwr
     d_roi_data = np.load(s_roi_data_in_fname, allow_pickle=True).item()
 
     # create a multi-part movie object
-    oc_mask_movie = CMuPaMovieTiff((s_roi_mask_in_fname,)) # notice the comma(!)
+    oc_mask_movie = _open_intermediate(s_roi_mask_in_fname)
 
     i_frame_id = 0
     oc_roi_picker = None
@@ -114,13 +177,24 @@ def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwr
     print("Number of ROIs collected: %i" % len(oc_roi_picker.l_ROI))
 
     # create a multi-part movie object
-    oc_reg_movie = CMuPaMovieTiff((s_register_in_fname,)) # notice the comma(!)
+    oc_reg_movie = _open_intermediate(s_register_in_fname)
+
+    # object for intensity projections calculation
+    oc_iproj = None
 
     i_frame_id = 0 # <--- RESET THE FRAME COUNTER ---
 
+    # intensity projections are calculated in the same pass, except of the
+    # features projection which depends on events detected in fluorescence traces
     while(oc_reg_movie.read_next_frame()):
-        if i_frame_id % 100 == 0: print("process frame (extract fluorescence traces): %i" % i_frame_id)
+        if i_frame_id % 100 == 0: print("process frame (extract fluorescence traces, calculate intensity projections): %i" % i_frame_id)
+        if i_frame_id == 0:
+            oc_iproj = CIntensityProjector(
+                oc_reg_movie.na_frame.shape[0], # frame height
+                oc_reg_movie.na_frame.shape[1]  # frame width
+            )
         oc_roi_picker.extract_fluo_from_frame(oc_reg_movie.na_frame)
+        oc_iproj.process_frame(oc_reg_movie.na_frame)
         i_frame_id += 1
         if i_max_nframes is not None and i_frame_id >= i_max_nframes: break
     oc_roi_picker.finalize_fluo()
@@ -155,27 +229,12 @@ def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwr
         na_dFF_SNR[ii] = na_median_at_events / median_abs_deviation(na_1trace)
     oc_roi_picker.d_FLUO['dFF_SNR'] = na_dFF_SNR
 
-    # RE-create a multi-part movie object
-    del oc_reg_movie
-    oc_reg_movie = None
-    oc_reg_movie = CMuPaMovieTiff((s_register_in_fname,)) # notice the comma(!)
-
-    # object for intensity projections calculation
-    oc_iproj = None
-
-    i_frame_id = 0 # <--- RESET THE FRAME COUNTER ---
-
-    while(oc_reg_movie.read_next_frame()):
-        if i_frame_id % 100 == 0: print("process frame (calculate intensity projections): %i" % i_frame_id)
-        if i_frame_id == 0:
-            oc_iproj = CIntensityProjector(
-                oc_reg_movie.na_frame.shape[0], # frame height
-                oc_reg_movie.na_frame.shape[1], # frame width
-                features=na_dFF_evt_peaks
-            )
-        oc_iproj.process_frame(oc_reg_movie.na_frame)
-        i_frame_id += 1
-        if i_max_nframes is not None and i_frame_id >= i_max_nframes: break
+    # features (local) intensity projection, only frames with events are read again
+    oc_iproj.set_features(na_dFF_evt_peaks)
+    for i_fet_frame_id in oc_iproj.na_featured_frame_ids:
+        if not oc_reg_movie.read_frame(int(i_fet_frame_id)):
+            raise IOError("Unable to read frame %i from: %s" % (i_fet_frame_id, s_register_in_fname))
+        oc_iproj.process_featured_frame(oc_reg_movie.na_frame)
     oc_iproj.finalize_projection()
 
     # add all key-value pairs from oc_iproj to oc_roi_picker
@@ -186,28 +245,53 @@ def pickup_rois_extract_fluo(s_target_dir, d_param, s_out_fname_prefix, b_overwr
 #
 
 
-def register_frames_detect_rois(s_target_dir, oc_frame_source, d_param, s_out_fname_prefix, b_overwrite_output=False, i_max_nframes=None):
+def _open_movie(t_in_files):
+    if t_in_files[0].endswith(".tiff") or t_in_files[0].endswith(".tif"):
+        return CMuPaMovieTiff(t_in_files)
+    elif t_in_files[0].endswith(".zip"):
+        return CMuPaMovieZF(t_in_files)
+    elif t_in_files[0].endswith(".ffii"):
+        return CMuPaMovieFFII(t_in_files, b_use_index=True)
+    else:
+        return CMuPaMovieCV(t_in_files, b_grayscale=True)
+#
+
+
+def register_frames_detect_rois(s_target_dir, oc_frame_source, d_param, s_out_fname_prefix, b_overwrite_output=False, i_max_nframes=None, \
+                                i_writer_queue_depth=16, s_scratch_dir=None, b_scratch_mask=True, b_archive_tiff=False):
     s_register_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "register.tiff")
     s_roi_fluo_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "roi_fluo.tiff")
     s_roi_mask_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "roi_mask.tiff")
     s_roi_data_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "roi_data.npy")
     s_reg_data_out_fname = os.path.join(s_target_dir, s_out_fname_prefix + "reg_data.npy")
 
+    # If s_scratch_dir is given, the registered movie (and the ROI mask if b_scratch_mask is True)
+    # is written uncompressed into the s_scratch_dir, to be passed to the pickup_rois_extract_fluo().
+    # The compressed tiff files are written in background only if b_archive_tiff is True,
+    # see archive_intermediates() for the returned thread.
+    if s_scratch_dir is None:
+        b_scratch_mask = False
+    else:
+        s_register_scr_fname, s_roi_mask_scr_fname = _scratch_fnames(s_scratch_dir, s_out_fname_prefix)
+
     if not b_overwrite_output:
-        _check_file(s_register_out_fname, b_check_absence=True)
+        if s_scratch_dir is None or b_archive_tiff:
+            _check_file(s_register_out_fname, b_check_absence=True)
+        if not b_scratch_mask or b_archive_tiff:
+            _check_file(s_roi_mask_out_fname, b_check_absence=True)
+        if s_scratch_dir is not None:
+            _check_file(s_register_scr_fname, b_check_absence=True)
+        if b_scratch_mask:
+            _check_file(s_roi_mask_scr_fname, b_check_absence=True)
         _check_file(s_roi_fluo_out_fname, b_check_absence=True)
-        _check_file(s_roi_mask_out_fname, b_check_absence=True)
         _check_file(s_roi_data_out_fname, b_check_absence=True)
         _check_file(s_reg_data_out_fname, b_check_absence=True)
 
     if isinstance(oc_frame_source, tuple):
-        t_in_files = oc_frame_source
-        if t_in_files[0].endswith(".tiff") or t_in_files[0].endswith(".tif"):
-            oc_movie = CMuPaMovieTiff(t_in_files)
-        elif t_in_files[0].endswith(".zip"):
-            oc_movie = CMuPaMovieZF(t_in_files)
-        else:
-            oc_movie = CMuPaMovieCV(t_in_files)
+        oc_movie = _open_movie(oc_frame_source)
+    elif isinstance(oc_frame_source, list):
+        # list of tuples, one per recording session, processed as a single movie
+        oc_movie = CMuPaMovieConcat([_open_movie(t_in_files) for t_in_files in oc_frame_source], i_max_open_files=2)
     else:
         oc_movie = oc_frame_source
 
@@ -229,10 +313,18 @@ def register_frames_detect_rois(s_target_dir, oc_frame_source, d_param, s_out_fn
         i_median_blur_size = 0
         s_med_blur = ""
 
-    # tiff file writer objects for output data
-    oc_register_writer = CSingleTiffWriter(s_register_out_fname, b_delete_existing=b_overwrite_output)
-    oc_roi_fluo_writer = CSingleTiffWriter(s_roi_fluo_out_fname, b_delete_existing=b_overwrite_output)
-    oc_roi_mask_writer = CSingleTiffWriter(s_roi_mask_out_fname, b_delete_existing=b_overwrite_output)
+    # file writer objects for output data, tiff frames are compressed and written in background
+    if s_scratch_dir is None:
+        oc_register_writer = CSingleTiffWriter(s_register_out_fname, b_delete_existing=b_overwrite_output, i_queue_depth=i_writer_queue_depth)
+    else:
+        # .npy files are allocated for the whole movie
+        i_nframes_max = oc_movie.i_nframes if i_max_nframes is None else min(oc_movie.i_nframes, i_max_nframes)
+        oc_register_writer = CSingleNpyWriter(s_register_scr_fname, i_nframes_max, b_delete_existing=b_overwrite_output)
+    oc_roi_fluo_writer = CSingleTiffWriter(s_roi_fluo_out_fname, b_delete_existing=b_overwrite_output, i_queue_depth=i_writer_queue_depth)
+    if b_scratch_mask:
+        oc_roi_mask_writer = CSingleNpyWriter(s_roi_mask_scr_fname, i_nframes_max, b_delete_existing=b_overwrite_output)
+    else:
+        oc_roi_mask_writer = CSingleTiffWriter(s_roi_mask_out_fname, b_delete_existing=b_overwrite_output, i_queue_depth=i_writer_queue_depth)
 
     oc_pcs_wiper = None
     oc_register = None
@@ -296,5 +388,9 @@ def register_frames_detect_rois(s_target_dir, oc_frame_source, d_param, s_out_fn
     oc_roi_mask_writer.close()
     np.save(s_reg_data_out_fname, oc_register.d_REG)
     np.save(s_roi_data_out_fname, oc_roi_detector.d_ROI)
+
+    if s_scratch_dir is not None and b_archive_tiff:
+        return archive_intermediates(s_target_dir, s_scratch_dir, s_out_fname_prefix, b_overwrite_output=b_overwrite_output)
+    return None
 #
 
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mendouscopy.datcontainer import CDatContainer
+from mendouscopy.mupamovie import CMuPaMovieNpy
+from mendouscopy.mupatime import CMuPaMovieTimed
+
+
+class CTestMuPaMovieTimed(unittest.TestCase):
+    def setUp(self):
+        s_examples_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+        self.oc_dat_container = CDatContainer(s_examples_dir)
+        self.s_tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.s_tmp_dir)
+
+    def make_movie(self, i_cam_num):
+        # movie of 1x1 pixel frames, one per timestamp of the camera i_cam_num
+        i_nframes = int(np.sum(self.oc_dat_container.d_DAT['camNum'] == i_cam_num))
+        s_fname = os.path.join(self.s_tmp_dir, "cam%d.npy" % i_cam_num)
+        na_movie = np.lib.format.open_memmap(s_fname, mode='w+', dtype=np.uint16, shape=(i_nframes, 1, 1))
+        na_movie[:, 0, 0] = np.arange(i_nframes) % (2**16)
+        del na_movie
+        return CMuPaMovieNpy((s_fname,))
+
+    def test_timestamp_dat(self):
+        d_DAT = self.oc_dat_container.d_DAT
+        na_first_mask = d_DAT['frameNum'] == 1
+        i_t0 = d_DAT['sysClock'][na_first_mask].min()
+        for i_cam_num in (0, 1):
+            oc_movie = self.make_movie(i_cam_num)
+            oc_timed = CMuPaMovieTimed(oc_movie, self.oc_dat_container, i_cam_num=i_cam_num)
+            self.assertEqual(oc_timed.na_times.shape[0], oc_movie.i_nframes)
+            # the offset between cameras is preserved (22 ms in the examples/timestamp.dat)
+            i_first = d_DAT['sysClock'][na_first_mask & (d_DAT['camNum'] == i_cam_num)][0]
+            self.assertEqual(oc_timed.na_times[0], i_first - i_t0)
+            self.assertTrue((np.diff(oc_timed.na_times) >= 0).all())
+
+            self.assertEqual(oc_timed.frame_at(oc_timed.na_times[0] - 1), -1)
+            self.assertEqual(oc_timed.frame_at(oc_timed.na_times[0]), 0)
+            i_mid = oc_movie.i_nframes // 2
+            f_mid_time = oc_timed.na_times[i_mid]
+            self.assertEqual(oc_timed.na_times[oc_timed.frame_at(f_mid_time)], f_mid_time)
+            self.assertEqual(oc_timed.nearest_frames([f_mid_time])[0], oc_timed.frame_at(f_mid_time))
+            self.assertEqual(len(oc_timed.frames_between(0, oc_timed.na_times[-1] + 1)), oc_movie.i_nframes)
+
+            self.assertTrue(oc_timed.read_frame_at(f_mid_time))
+            self.assertEqual(oc_movie.na_frame[0, 0], oc_timed.frame_at(f_mid_time) % (2**16))
+            oc_movie.close()
+
+
+if __name__ == '__main__':
+    unittest.main()